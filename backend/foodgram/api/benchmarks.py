@@ -0,0 +1,257 @@
+import base64
+import io
+import os
+import random
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Ingredient, IngredientsAmount, Recipe, Tag
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from users.authentication import CachedTokenAuthentication, token_cache
+from users.models import User
+
+from .cache import TAG_IDS_CACHE_KEY, invalidate
+from .fast_serializers import (RECIPE_COLUMNS, USER_COLUMNS,
+                               FastRecipeSerializer, FastUserSerializer)
+from .filters import RecipeFilter
+from .parsers import FastJSONParser
+from .renderers import FastJSONRenderer
+from .serializers import RecipeSerializer, UserSerializer
+
+# Бенчмарки команды manage.py benchmark: имя -> функция(options),
+# которая возвращает строки отчёта.
+BENCHMARKS = {}
+
+
+def register(function):
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def measure(function, repeat):
+    """Лучшее и медианное время вызова function, мс."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings), statistics.median(timings)
+
+
+@contextmanager
+def rollback():
+    """Данные, созданные внутри блока, не сохраняются в базе.
+
+    bulk_create не шлёт сигналов, поэтому кэш тегов сбрасывается явно.
+    """
+    try:
+        with transaction.atomic():
+            yield
+            transaction.set_rollback(True)
+    finally:
+        invalidate(TAG_IDS_CACHE_KEY)
+
+
+def create_recipes(count, tags_count, authors_count=50, tags_per_recipe=2):
+    prefix = f'bench{time.monotonic_ns()}'
+    authors = User.objects.bulk_create(
+        User(
+            username=f'{prefix}_{index}',
+            email=f'{prefix}_{index}@bench.local',
+            first_name='Bench', last_name='Bench',
+        )
+        for index in range(authors_count)
+    )
+    if not authors[0].pk:
+        authors = list(User.objects.filter(username__startswith=prefix))
+    tags = Tag.objects.bulk_create(
+        Tag(
+            name=f'{prefix}_{index}', color=f'#{index % 0x1000000:06X}',
+            slug=f'{prefix}-{index}',
+        )
+        for index in range(tags_count)
+    )
+    if not tags[0].pk:
+        tags = list(Tag.objects.filter(slug__startswith=prefix))
+    recipes = Recipe.objects.bulk_create(
+        Recipe(
+            author=random.choice(authors), name=f'Рецепт {index}',
+            text='Текст', cooking_time=10,
+        )
+        for index in range(count)
+    )
+    if not recipes[0].pk:
+        recipes = list(Recipe.objects.filter(author__in=authors))
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag.pk)
+        for recipe in recipes
+        for tag in random.sample(tags, min(tags_per_recipe, len(tags)))
+    )
+    invalidate(TAG_IDS_CACHE_KEY)
+    return authors, tags
+
+
+def add_ingredients(authors, ingredients_count=50, per_recipe=5):
+    """Добавляет ингредиенты рецептам авторов из create_recipes()."""
+    ingredients = Ingredient.objects.bulk_create(
+        Ingredient(name=f'bench {index}', measurement_unit='г')
+        for index in range(ingredients_count)
+    )
+    if not ingredients[0].pk:
+        ingredients = list(
+            Ingredient.objects.filter(name__startswith='bench ')
+        )
+    IngredientsAmount.objects.bulk_create(
+        IngredientsAmount(recipe_id=recipe_id, ingredient=ingredient)
+        for recipe_id in Recipe.objects.filter(
+            author__in=authors
+        ).values_list('id', flat=True)
+        for ingredient in random.sample(ingredients, per_recipe)
+    )
+
+
+@register
+def recipe_filters(options):
+    """План и время первой страницы с фильтрами author и tags."""
+    for scale in options['scale']:
+        with rollback():
+            authors, tags = create_recipes(scale, max(scale // 100, 2))
+            params = {
+                'author': f'{authors[0].pk},{authors[1].pk}',
+                'tags': [tag.slug for tag in tags[:2]],
+            }
+            queryset = RecipeFilter(
+                params, queryset=Recipe.objects.all()
+            ).qs
+            best, median = measure(
+                lambda: list(queryset.all()[:6]), options['repeat']
+            )
+            yield (
+                f'recipes={scale} tags={len(tags)}: '
+                f'best {best:.2f} ms, median {median:.2f} ms'
+            )
+            for line in queryset[:6].explain().splitlines():
+                yield f'    {line}'
+
+
+@register
+def authentication(options):
+    """Проверка токена с запросом к базе и через кэш процесса."""
+    with rollback():
+        user = User.objects.create(
+            username=f'bench{time.monotonic_ns()}', email='bench@bench.local'
+        )
+        key = Token.objects.create(user=user).key
+        token_cache.clear()
+        for backend in (TokenAuthentication, CachedTokenAuthentication):
+            authenticate = backend().authenticate_credentials
+            authenticate(key)
+            with CaptureQueriesContext(connection) as queries:
+                best, median = measure(
+                    lambda: authenticate(key), options['repeat']
+                )
+            yield (
+                f'{backend.__name__}: best {best * 1000:.1f} us, '
+                f'median {median * 1000:.1f} us, '
+                f'queries {len(queries) / options["repeat"]:.0f}/request'
+            )
+        token_cache.clear()
+
+
+SERIALIZER_PAGE_SIZES = (6, 100, 1000)
+
+
+@register
+def serializers(options):
+    """Страница списка: сериализаторы DRF против api.fast_serializers."""
+    with rollback():
+        size = max(SERIALIZER_PAGE_SIZES)
+        authors, _ = create_recipes(size, 10, authors_count=size)
+        add_ingredients(authors)
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = authors[0]
+        context = {'request': request}
+        recipes = Recipe.objects.filter(author__in=authors).order_by('id')
+        users = User.objects.filter(pk__in=[author.pk for author in authors])
+        cases = (
+            ('recipes', RecipeSerializer, recipes.prefetch_for_read(),
+             FastRecipeSerializer, recipes.values(*RECIPE_COLUMNS)),
+            ('users', UserSerializer, users,
+             FastUserSerializer, users.values(*USER_COLUMNS)),
+        )
+        for name, slow, slow_queryset, fast, fast_queryset in cases:
+            for size in SERIALIZER_PAGE_SIZES:
+                line = f'{name} page={size}:'
+                for serializer, queryset in (
+                    (slow, slow_queryset), (fast, fast_queryset),
+                ):
+                    best, median = measure(
+                        lambda: serializer(
+                            queryset[:size], many=True, context=context
+                        ).data,
+                        options['repeat'],
+                    )
+                    line += (
+                        f' {serializer.__name__} best {best:.2f} ms, '
+                        f'median {median:.2f} ms;'
+                    )
+                yield line.rstrip(';')
+
+
+JSON_IMAGE_SIZES = (100 * 1024, 4 * 1024 * 1024)
+
+
+@register
+def json_codec(options):
+    """Рендер страниц рецептов и разбор тела с картинкой: DRF и orjson."""
+    with rollback():
+        size = max(SERIALIZER_PAGE_SIZES)
+        authors, _ = create_recipes(size, 10, authors_count=size)
+        add_ingredients(authors)
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = authors[0]
+        recipes = Recipe.objects.filter(
+            author__in=authors
+        ).order_by('id').values(*RECIPE_COLUMNS)
+        for size in SERIALIZER_PAGE_SIZES:
+            data = {
+                'count': size,
+                'results': FastRecipeSerializer(
+                    recipes[:size], many=True, context={'request': request}
+                ).data,
+            }
+            line = f'render page={size}:'
+            for renderer in (JSONRenderer(), FastJSONRenderer()):
+                best, median = measure(
+                    lambda: renderer.render(data), options['repeat']
+                )
+                line += (
+                    f' {type(renderer).__name__} best {best:.2f} ms, '
+                    f'median {median:.2f} ms;'
+                )
+            yield line.rstrip(';')
+    for image_size in JSON_IMAGE_SIZES:
+        image = base64.b64encode(os.urandom(image_size)).decode()
+        body = (
+            '{"name": "Рецепт", "text": "Текст", "cooking_time": 10, '
+            '"tags": [1, 2], "ingredients": [{"id": 1, "amount": 10}], '
+            f'"image": "data:image/png;base64,{image}"}}'
+        ).encode()
+        line = f'parse image={image_size // 1024} KiB:'
+        for parser in (JSONParser(), FastJSONParser()):
+            best, median = measure(
+                lambda: parser.parse(io.BytesIO(body)), options['repeat']
+            )
+            line += (
+                f' {type(parser).__name__} best {best:.2f} ms, '
+                f'median {median:.2f} ms;'
+            )
+        yield line.rstrip(';')
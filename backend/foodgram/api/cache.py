@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from .renderers import get_json_renderer_class
+
+INGREDIENTS_CACHE_KEY = 'reference:ingredients'
+TAGS_CACHE_KEY = 'reference:tags'
+TAG_IDS_CACHE_KEY = 'reference:tag_ids'
+RECIPES_GENERATION_KEY = 'recipes:generation'
+
+
+def get_payload(key, build, timeout=None):
+    """Готовое тело ответа из кэша; при промахе строит его из build()."""
+    payload = cache.get(key)
+    if payload is None:
+        body = get_json_renderer_class()().render(build())
+        digest = hashlib.sha256(body).hexdigest()
+        payload = {
+            'body': body,
+            'gzip': gzip.compress(body),
+            'etag': f'"{digest}"',
+            'gzip_etag': f'"{digest}-gzip"',
+        }
+        cache.set(
+            key, payload,
+            settings.REFERENCE_DATA_CACHE_TIMEOUT if timeout is None
+            else timeout
+        )
+    return payload
+
+
+def payload_response(request, payload):
+    """Ответ из готовых байтов: 304 по ETag, gzip если клиент умеет."""
+    use_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    etag = payload['gzip_etag'] if use_gzip else payload['etag']
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if etag in if_none_match or if_none_match.strip() == '*':
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(
+            payload['gzip'] if use_gzip else payload['body'],
+            content_type='application/json',
+        )
+        if use_gzip:
+            response['Content-Encoding'] = 'gzip'
+        response['Content-Length'] = len(response.content)
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def invalidate(*keys):
+    cache.delete_many(keys)
+
+
+class CachedListMixin:
+    """list() без параметров отдаётся из кэша готовых байтов.
+
+    Подклассы задают list_cache_key; кэш сбрасывается сигналами
+    из api.signals при изменении модели.
+    """
+
+    list_cache_key = None
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        payload = get_payload(
+            self.list_cache_key,
+            lambda: self.get_serializer(
+                self.filter_queryset(self.get_queryset()), many=True
+            ).data
+        )
+        return payload_response(request, payload)
+
+
+def get_generation(key):
+    """Текущее поколение данных; входит в ключи зависящих от них ответов."""
+    cache.add(key, 1, None)
+    return cache.get(key, 1)
+
+
+def bump_generation(key):
+    """Делает устаревшими все ответы, закэшированные с прежним поколением."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+
+
+class AnonymousCacheMixin:
+    """list() и retrieve() для анонимов отдаются из общего кэша.
+
+    Ключ — схема и хост запроса (ответы содержат абсолютные ссылки),
+    действие, id объекта и нормализованные параметры запроса вместе
+    с поколением из generation_key; сигналы api.signals повышают
+    поколение при изменении данных.
+    """
+
+    generation_key = None
+
+    def use_anonymous_cache(self, request):
+        return (
+            not request.user.is_authenticated
+            and request.accepted_renderer.format == 'json'
+        )
+
+    def anonymous_cache_key(self, request):
+        params = sorted(
+            (key, sorted(value for value in values if value))
+            for key, values in request.query_params.lists()
+        )
+        raw = json.dumps(
+            [
+                request.scheme, request.get_host(), self.action,
+                self.kwargs.get(self.lookup_field), params,
+            ],
+            ensure_ascii=False,
+        )
+        digest = hashlib.sha1(raw.encode()).hexdigest()
+        generation = get_generation(self.generation_key)
+        return f'{self.generation_key}:{generation}:{digest}'
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        payload = get_payload(
+            self.anonymous_cache_key(request),
+            lambda: handler(request, *args, **kwargs).data,
+            settings.ANONYMOUS_CACHE_TIMEOUT,
+        )
+        return payload_response(request, payload)
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_anonymous_cache(request):
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_anonymous_cache(request):
+            return super().retrieve(request, *args, **kwargs)
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs
+        )
@@ -0,0 +1,151 @@
+"""Сериализаторы чтения для list и retrieve без полей DRF.
+
+Работают со строками .values() (колонки в RECIPE_COLUMNS и
+USER_COLUMNS): связанные теги и ингредиенты всей страницы достаются
+одним запросом на связь и раскладываются по картам recipe_id -> список.
+Вывод совпадает с RecipeSerializer и UserSerializer байт в байт.
+"""
+from collections import defaultdict
+
+from recipes.images import variant_urls
+from recipes.models import IngredientsAmount, Recipe
+from rest_framework import serializers
+
+from .relations import EMPTY, get_relations
+
+USER_COLUMNS = ('email', 'id', 'username', 'first_name', 'last_name')
+RECIPE_COLUMNS = (
+    'id', 'name', 'image', 'image_variants', 'text', 'cooking_time',
+) + tuple(f'author__{column}' for column in USER_COLUMNS)
+TAG_COLUMNS = ('id', 'name', 'color', 'slug')
+INGREDIENT_COLUMNS = ('id', 'name', 'measurement_unit')
+
+image_storage = Recipe._meta.get_field('image').storage
+
+
+class FastListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        return self.child.represent_many(list(data))
+
+
+class FastReadSerializer(serializers.BaseSerializer):
+    """Только чтение: страница целиком обрабатывается represent_many."""
+
+    class Meta:
+        list_serializer_class = FastListSerializer
+
+    def to_representation(self, instance):
+        return self.represent_many([instance])[0]
+
+    def get_relations(self):
+        request = self.context.get('request')
+        if request is None:
+            return EMPTY
+        return get_relations(request)
+
+    def represent_many(self, rows):
+        raise NotImplementedError
+
+
+def represent_user(row, subscriptions, prefix=''):
+    return {
+        'email': row[f'{prefix}email'],
+        'id': row[f'{prefix}id'],
+        'username': row[f'{prefix}username'],
+        'first_name': row[f'{prefix}first_name'],
+        'last_name': row[f'{prefix}last_name'],
+        'is_subscribed': row[f'{prefix}id'] in subscriptions,
+    }
+
+
+class FastUserSerializer(FastReadSerializer):
+    def represent_many(self, rows):
+        subscriptions = self.get_relations()['subscriptions']
+        return [represent_user(row, subscriptions) for row in rows]
+
+
+def tag_row(tag):
+    return {column: getattr(tag, column) for column in TAG_COLUMNS}
+
+
+def recipe_row(recipe):
+    """Строка как из .values(*RECIPE_COLUMNS) для рецепта в памяти."""
+    row = {
+        column: getattr(recipe, column) for column in RECIPE_COLUMNS
+        if not column.startswith('author__')
+    }
+    row['image'] = recipe.image.name
+    for column in USER_COLUMNS:
+        row[f'author__{column}'] = getattr(recipe.author, column)
+    return row
+
+
+def tags_by_recipe(recipe_ids):
+    tags = defaultdict(list)
+    rows = Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('tag_id').values_list(
+        'recipe_id', *(f'tag__{column}' for column in TAG_COLUMNS)
+    )
+    for recipe_id, *values in rows:
+        tags[recipe_id].append(dict(zip(TAG_COLUMNS, values)))
+    return tags
+
+
+def ingredients_by_recipe(recipe_ids):
+    ingredients = defaultdict(list)
+    rows = IngredientsAmount.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('id').values_list(
+        'recipe_id',
+        *(f'ingredient__{column}' for column in INGREDIENT_COLUMNS),
+        'amount',
+    )
+    for recipe_id, *values in rows:
+        ingredients[recipe_id].append(
+            dict(zip(INGREDIENT_COLUMNS + ('amount',), values))
+        )
+    return ingredients
+
+
+class FastRecipeSerializer(FastReadSerializer):
+    def image_url(self, name):
+        if not name:
+            return None
+        url = image_storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def represent_many(self, rows, tags=None):
+        """tags — готовая карта recipe_id -> список тегов, если известна."""
+        if not rows:
+            return []
+        request = self.context.get('request')
+        relations = self.get_relations()
+        favorites = relations['favorites']
+        cart = relations['cart']
+        subscriptions = relations['subscriptions']
+        recipe_ids = [row['id'] for row in rows]
+        if tags is None:
+            tags = tags_by_recipe(recipe_ids)
+        ingredients = ingredients_by_recipe(recipe_ids)
+        return [
+            {
+                'id': row['id'],
+                'tags': tags[row['id']],
+                'author': represent_user(row, subscriptions, 'author__'),
+                'ingredients': ingredients[row['id']],
+                'is_favorited': row['id'] in favorites,
+                'is_in_shopping_cart': row['id'] in cart,
+                'image_variants': variant_urls(
+                    row['image_variants'], request
+                ),
+                'name': row['name'],
+                'image': self.image_url(row['image']),
+                'text': row['text'],
+                'cooking_time': row['cooking_time'],
+            }
+            for row in rows
+        ]
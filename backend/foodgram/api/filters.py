@@ -1,5 +1,42 @@
 import django_filters
+from django import forms
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
 from recipes.models import Recipe, Tag
+from recipes.search import search_recipes
+from rest_framework.filters import OrderingFilter
+
+from .cache import TAG_IDS_CACHE_KEY
+from .relations import get_relations
+
+
+def get_tag_ids():
+    """Словарь slug -> id тегов; кэш сбрасывается сигналами api.signals."""
+    tag_ids = cache.get(TAG_IDS_CACHE_KEY)
+    if tag_ids is None:
+        tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(
+            TAG_IDS_CACHE_KEY, tag_ids, settings.REFERENCE_DATA_CACHE_TIMEOUT
+        )
+    return tag_ids
+
+
+class SlugListField(forms.Field):
+    """Все значения повторяющегося параметра (?tags=a&tags=b)."""
+
+    widget = forms.SelectMultiple
+
+    def to_python(self, value):
+        return [slug for slug in value or () if slug]
+
+
+class SlugListFilter(django_filters.Filter):
+    field_class = SlugListField
+
+
+class IdInFilter(django_filters.BaseInFilter, django_filters.NumberFilter):
+    field_class = forms.IntegerField
 
 
 class RecipeFilter(django_filters.FilterSet):
@@ -14,27 +51,64 @@ class RecipeFilter(django_filters.FilterSet):
         method='filter_is_in_shopping_cart'
     )
 
-    author = django_filters.CharFilter(
-        field_name="author__id",
-        lookup_expr="icontains"
+    author = IdInFilter(
+        field_name='author_id',
+        lookup_expr='in'
     )
 
-    tags = django_filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        queryset=Tag.objects.all(),
-        to_field_name='slug'
-    )
+    search = django_filters.CharFilter(method='filter_search')
+
+    tags = SlugListFilter(method='filter_tags')
+
+    def filter_search(self, queryset, name, value):
+        if value.strip():
+            return search_recipes(queryset, value)
+        return queryset
+
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        tag_ids = get_tag_ids()
+        ids = [tag_ids[slug] for slug in value if slug in tag_ids]
+        if not ids:
+            return queryset.none()
+        return queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef('pk'), tag_id__in=ids
+                )
+            )
+        )
+
+    def filter_relation(self, queryset, relation):
+        ids = get_relations(self.request)[relation]
+        if not ids:
+            return queryset.none()
+        return queryset.filter(id__in=sorted(ids))
 
     def filter_favorited(self, queryset, name, value):
         if value:
-            return queryset.filter(is_favorited=True)
+            return self.filter_relation(queryset, 'favorites')
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if value:
-            return queryset.filter(is_in_shopping_cart=True)
+            return self.filter_relation(queryset, 'cart')
         return queryset
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags')
+        fields = ('author', 'tags', 'search')
+
+
+class ExplicitOrderingFilter(OrderingFilter):
+    """Сортирует только по явному ?ordering.
+
+    Без параметра сохраняется порядок, заданный фильтрами, например
+    по релевантности поиска.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if not request.query_params.get(self.ordering_param):
+            return queryset
+        return super().filter_queryset(request, queryset, view)
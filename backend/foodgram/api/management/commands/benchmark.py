@@ -0,0 +1,38 @@
+from api.benchmarks import BENCHMARKS
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Запускает бенчмарки из api.benchmarks на текущей базе.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names', nargs='*',
+            help='Имена бенчмарков; по умолчанию все.',
+        )
+        parser.add_argument(
+            '--list', action='store_true',
+            help='Показать доступные бенчмарки.',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Число повторов каждого замера.',
+        )
+        parser.add_argument(
+            '--scale', type=int, nargs='+', default=[1000, 10000],
+            help='Размеры синтетических данных.',
+        )
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for name, function in BENCHMARKS.items():
+                self.stdout.write(f'{name}: {function.__doc__}')
+            return
+        names = options['names'] or list(BENCHMARKS)
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f'Unknown benchmarks: {", ".join(unknown)}')
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for line in BENCHMARKS[name](options):
+                self.stdout.write(line)
@@ -1,8 +1,102 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from foodgram.db import count_rows
+from foodgram.paginator import EstimatedPaginator
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+class CountingPaginator(EstimatedPaginator):
+    """Пагинатор с дешёвым подсчётом строк.
+
+    Считается выборка только из pk, без аннотаций в SELECT и без
+    сортировки. Результат кэшируется по тексту запроса, то есть
+    отдельно для каждой комбинации фильтров, на
+    PAGINATION_COUNT_CACHE_TIMEOUT секунд. Большие выборки считаются
+    по оценке планировщика, тогда count_exact ложно и следующая
+    страница определяется чтением лишней строки.
+    """
+
+    def count_rows(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count_rows()
+        queryset = self.object_list.order_by().values('pk')
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0, True
+        key = 'count:' + hashlib.sha1(
+            f'{queryset.db}:{sql}:{params}'.encode()
+        ).hexdigest()
+        result = cache.get(key)
+        if result is None:
+            result = count_rows(
+                queryset, settings.PAGINATION_EXACT_COUNT_LIMIT
+            )
+            cache.set(key, result, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        return result
+
+
+class IdCursorPagination(CursorPagination):
+    """Курсорная пагинация по id: стоимость не зависит от глубины."""
+
+    ordering = 'id'
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 1000
 
 
 class PageAndLimitPagination(PageNumberPagination):
+    """Постраничная пагинация с переключением в курсорный режим.
+
+    Курсорный режим включается параметром ?pagination=cursor или
+    переданным курсором; в нём ответ содержит next и previous без count.
+    """
+
+    django_paginator_class = CountingPaginator
     page_size = 6
     page_query_param = 'page'
     page_size_query_param = 'limit'
     max_page_size = 1000
+    mode_query_param = 'pagination'
+    cursor_pagination_class = IdCursorPagination
+    cursor_paginator = None
+
+    def use_cursor(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_pagination_class.cursor_query_param
+            in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.use_cursor(request):
+            return super().paginate_queryset(queryset, request, view)
+        self.cursor_paginator = self.cursor_pagination_class()
+        page = self.cursor_paginator.paginate_queryset(
+            queryset, request, view
+        )
+        self.display_page_controls = (
+            self.cursor_paginator.display_page_controls
+        )
+        return page
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('count_exact', self.page.paginator.count_exact),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def to_html(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
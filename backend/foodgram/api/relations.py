@@ -0,0 +1,61 @@
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import IntegerField, Value
+from recipes.models import FavorRecipe, ShoppingCart
+from users.models import UserSubscription
+
+# Наборы id, связанных с пользователем: имя -> (модель, поле с id).
+RELATIONS = {
+    'favorites': (FavorRecipe, 'recipe_id'),
+    'cart': (ShoppingCart, 'recipe_id'),
+    'subscriptions': (UserSubscription, 'subscribe_to_id'),
+}
+EMPTY = {name: frozenset() for name in RELATIONS}
+
+
+def _cache_key(user_id):
+    return f'user:{user_id}:relations'
+
+
+def _load(user_id):
+    """Все наборы одним запросом UNION ALL."""
+    names = list(RELATIONS)
+    querysets = [
+        model.objects.filter(user_id=user_id).annotate(
+            kind=Value(index, output_field=IntegerField())
+        ).values_list(field, 'kind').order_by()
+        for index, (model, field) in enumerate(RELATIONS.values())
+    ]
+    ids = {name: array('q') for name in names}
+    for related_id, kind in querysets[0].union(*querysets[1:], all=True):
+        ids[names[kind]].append(related_id)
+    return ids
+
+
+def get_relations(request):
+    """Избранное, корзина и подписки пользователя как frozenset id.
+
+    Загружаются один раз за запрос (запоминаются на объекте запроса)
+    и хранятся в кэше компактными массивами до сброса
+    invalidate_relations() или USER_RELATIONS_CACHE_TIMEOUT.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return EMPTY
+    relations = getattr(request, '_relations', None)
+    if relations is None:
+        key = _cache_key(user.pk)
+        ids = cache.get(key)
+        if ids is None:
+            ids = _load(user.pk)
+            cache.set(key, ids, settings.USER_RELATIONS_CACHE_TIMEOUT)
+        relations = {name: frozenset(values) for name, values in ids.items()}
+        request._relations = relations
+    return relations
+
+
+def invalidate_relations(request):
+    cache.delete(_cache_key(request.user.pk))
+    request._relations = None
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Разделители строк, которые JSON допускает, а JavaScript нет; DRF
+# всегда экранирует их в ответах.
+LINE_SEPARATORS = (
+    ('\u2028'.encode(), b'\\u2028'),
+    ('\u2029'.encode(), b'\\u2029'),
+)
+
+
+class FileRenderer(BaseRenderer):
+    """Рендерер для файлов, которые view отдаёт сам.
+
+    Нужен, чтобы DRF принимал ``?format=txt|csv|pdf`` и Accept
+    с типом файла. Тело файла формирует view, а сюда попадают только
+    ответы с ошибками.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, bytes):
+            return data
+        return str(data).encode('utf-8')
+
+
+class PlainTextRenderer(FileRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(FileRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFRenderer(FileRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson с тем же выводом.
+
+    Типы, которых orjson не знает (Decimal, ленивые строки), и
+    datetime (DRF пишет UTC как «Z») уходят в энкодер DRF. Без
+    orjson, с отступами (browsable API) и при ошибке кодирования
+    работает обычный JSONRenderer.
+    """
+
+    if orjson is not None:
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(
+            accepted_media_type, renderer_context or {}
+        ) is not None:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        try:
+            body = orjson.dumps(
+                data, default=JSONEncoder().default, option=self.options
+            )
+        except orjson.JSONEncodeError:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        for separator, escaped in LINE_SEPARATORS:
+            body = body.replace(separator, escaped)
+        return body
+
+
+def get_json_renderer_class():
+    """Рендерер JSON из settings.API_JSON_RENDERER."""
+    return import_string(settings.API_JSON_RENDERER)
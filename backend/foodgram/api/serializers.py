@@ -1,17 +1,38 @@
-from django.db import IntegrityError
-from django.db.models import Prefetch
-from django.http import Http404
+from operator import attrgetter
+
+from django.db import transaction
 from drf_extra_fields.fields import Base64ImageField
+from recipes.images import schedule_variants, variant_urls
 from recipes.models import (FavorRecipe, Ingredient, IngredientsAmount, Recipe,
-                            ShoppingCart, Tag)
+                            ShoppingListItem, Tag)
+from recipes.signals import recipe_changed
 from rest_framework import serializers
-from users.models import User, UserSubscription
+from users.models import User
+
+from .fast_serializers import FastRecipeSerializer, recipe_row, tag_row
+from .relations import get_relations
+
+
+class RelationField(serializers.Field):
+    """Входит ли объект в набор relation текущего пользователя."""
+
+    def __init__(self, relation, **kwargs):
+        self.relation = relation
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        request = self.context.get('request')
+        if request is None:
+            return False
+        return instance.pk in get_relations(request)[self.relation]
 
 
 class UserSerializer(serializers.ModelSerializer):
     """Сериализация пользователей"""
 
-    is_subscribed = serializers.BooleanField(required=False)
+    is_subscribed = RelationField('subscriptions')
     password = serializers.CharField(
         style={'input_type': 'password'},
         max_length=150,
@@ -51,6 +72,15 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
 
+class UserCreateSerializer(UserSerializer):
+    """Регистрация: у нового пользователя ещё нет подписчиков."""
+
+    class Meta(UserSerializer.Meta):
+        fields = (
+            'email', 'id', 'username', 'first_name', 'last_name', 'password',
+        )
+
+
 class ChangePasswordSerializer(serializers.Serializer):
     """Serializer for password change endpoint."""
 
@@ -74,7 +104,7 @@ class ChangePasswordSerializer(serializers.Serializer):
         password = self.validated_data['new_password']
         user = self.context['user']
         user.set_password(password)
-        user.save()
+        user.save(update_fields=['password'])
         return user
 
 
@@ -96,6 +126,15 @@ class IngredientSerializer(serializers.ModelSerializer):
         )
 
 
+class IngredientSearchSerializer(serializers.Serializer):
+    """Проверка параметров поиска ингредиентов"""
+
+    name = serializers.CharField(required=False, allow_blank=True)
+    limit = serializers.IntegerField(
+        min_value=1, max_value=1000, required=False
+    )
+
+
 class IngredientsAmountSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='ingredient.id')
     name = serializers.ReadOnlyField(source='ingredient.name')
@@ -110,6 +149,17 @@ class IngredientsAmountSerializer(serializers.ModelSerializer):
         )
 
 
+class ImageVariantsField(serializers.Field):
+    """URL уменьшенных копий картинки рецепта"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return variant_urls(value, self.context.get('request'))
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Сериализация чтения рецептов"""
 
@@ -119,8 +169,9 @@ class RecipeSerializer(serializers.ModelSerializer):
         source='ingredientsamount_set',
         many=True
     )
-    is_favorited = serializers.BooleanField()
-    is_in_shopping_cart = serializers.BooleanField()
+    is_favorited = RelationField('favorites')
+    is_in_shopping_cart = RelationField('cart')
+    image_variants = ImageVariantsField()
 
     def validate_cooking_time(self, value):
         if value < 1:
@@ -131,15 +182,49 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        exclude = ('favorites', 'shopping_carts',)
+        exclude = (
+            'favorites',
+            'shopping_carts',
+            'favorites_count',
+            'in_cart_count',
+        )
+
+
+class PrimaryKeyListField(serializers.ListField):
+    """Список id, которые проверяются одним запросом id IN (...).
+
+    Возвращает объекты queryset в порядке id из запроса, без повторов.
+    """
+
+    default_error_messages = {
+        'does_not_exist': 'Unknown ids: {ids}.',
+    }
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        kwargs['child'] = serializers.IntegerField()
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        ids = list(dict.fromkeys(super().to_internal_value(data)))
+        objects = self.queryset.in_bulk(ids)
+        unknown = [pk for pk in ids if pk not in objects]
+        if unknown:
+            self.fail(
+                'does_not_exist', ids=', '.join(map(str, unknown))
+            )
+        return [objects[pk] for pk in ids]
+
+    def to_representation(self, data):
+        return [obj.pk for obj in data.all()]
 
 
 class WriteIngredientsAmountSerializer(serializers.Serializer):
-    id = serializers.CharField(source='ingredient.id')
-    amount = serializers.CharField(source='ingredient.amount')
+    id = serializers.IntegerField()
+    amount = serializers.IntegerField()
 
     def validate_amount(self, value):
-        if int(value) <= 0:
+        if value <= 0:
             raise serializers.ValidationError(
                 'Amount have to be more than 0!'
             )
@@ -152,10 +237,8 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         many=True,
         required=True,
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
+    tags = PrimaryKeyListField(
         queryset=Tag.objects.all(),
-        read_only=False,
         required=True,
     )
     image = Base64ImageField(required=False)
@@ -175,46 +258,128 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             )
         return value
 
+    def validate_ingredients(self, value):
+        """{id ингредиента: количество}; повторы складываются.
+
+        Все id проверяются одним запросом.
+        """
+        amounts = {}
+        for ingredient in value:
+            amounts[ingredient['id']] = (
+                amounts.get(ingredient['id'], 0) + ingredient['amount']
+            )
+        known = set(
+            Ingredient.objects.filter(
+                id__in=amounts
+            ).values_list('id', flat=True)
+        )
+        unknown = [pk for pk in amounts if pk not in known]
+        if unknown:
+            raise serializers.ValidationError(
+                f'Unknown ingredient ids: {", ".join(map(str, unknown))}.'
+            )
+        return amounts
+
+    @staticmethod
+    def _sync_ingredients(recipe, amounts):
+        """Приводит ингредиенты рецепта к amounts, трогая только разницу.
+
+        Возвращает id ингредиентов, которые добавились, удалились или
+        поменяли количество.
+        """
+        existing = {
+            ingredient_id: (pk, amount)
+            for pk, ingredient_id, amount in IngredientsAmount.objects.filter(
+                recipe=recipe
+            ).values_list('id', 'ingredient_id', 'amount')
+        }
+        touched = set()
+        removed = []
+        changed = []
+        for ingredient_id, (pk, amount) in existing.items():
+            if ingredient_id not in amounts:
+                removed.append(pk)
+            elif amounts[ingredient_id] != amount:
+                changed.append(
+                    IngredientsAmount(id=pk, amount=amounts[ingredient_id])
+                )
+            else:
+                continue
+            touched.add(ingredient_id)
+        added = [
+            IngredientsAmount(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        ]
+        touched.update(amount.ingredient_id for amount in added)
+        if removed:
+            IngredientsAmount.objects.filter(id__in=removed).delete()
+        IngredientsAmount.objects.bulk_create(added)
+        IngredientsAmount.objects.bulk_update(changed, ['amount'])
+        return touched
+
     @staticmethod
-    def _link_recipe_ingridients(recipe, ingredients_data):
-        objs = []
-        for ingredient in ingredients_data:
-            amount = ingredient['ingredient']['amount']
-            ingredient_id = ingredient['ingredient']['id']
-            objs.append(IngredientsAmount(
-                recipe=recipe,
-                ingredient_id=ingredient_id,
-                amount=amount,
-            ))
-        try:
-            IngredientsAmount.objects.bulk_create(objs)
-        except IntegrityError:
-            raise Http404()
+    def _ingredients_changed(recipe, ingredient_ids):
+        """Сброс кэшей и списков покупок после правки ингредиентов."""
+        # bulk-операции не шлют сигналов.
+        recipe_changed.send(sender=Recipe, recipe_id=recipe.pk)
+        user_ids = list(recipe.shopping_carts.values_list('id', flat=True))
+        if user_ids:
+            ShoppingListItem.objects.refresh(user_ids, ingredient_ids)
 
     def create(self, validated_data):
-        ingredients_data = validated_data.pop('ingredients')
-        recipe = super().create(validated_data)
-        recipe.save()
-        self._link_recipe_ingridients(recipe, ingredients_data)
+        amounts = validated_data.pop('ingredients')
+        self.written_tags = validated_data.pop('tags')
+        with transaction.atomic():
+            recipe = Recipe.objects.create(**validated_data)
+            recipe.tags.set(self.written_tags)
+            self._sync_ingredients(recipe, amounts)
+        schedule_variants(recipe)
         return recipe
 
     def update(self, instance, validated_data):
-        ingredients_data = validated_data.pop('ingredients')
-        instance = super().update(instance, validated_data)
-        instance.ingredients.clear()
-        self._link_recipe_ingridients(instance, ingredients_data)
+        amounts = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        validated_data.pop('author', None)
+        if 'image' in validated_data:
+            validated_data['image_variants'] = {}
+        update_fields = [
+            field for field, value in validated_data.items()
+            if field == 'image' or getattr(instance, field) != value
+        ]
+        for field in update_fields:
+            setattr(instance, field, validated_data[field])
+        changed_ingredients = set()
+        with transaction.atomic():
+            if update_fields:
+                instance.save(update_fields=update_fields)
+            if tags is not None:
+                instance.tags.set(tags)
+                self.written_tags = tags
+            if amounts is not None:
+                changed_ingredients = self._sync_ingredients(
+                    instance, amounts
+                )
+            if changed_ingredients:
+                self._ingredients_changed(instance, changed_ingredients)
+        if 'image' in update_fields:
+            schedule_variants(instance)
         return instance
 
     def to_representation(self, instance):
-        user = self.context['request'].user
-        recipe = Recipe.objects.add_user_annotation(user.id).prefetch_related(
-            Prefetch(
-                'author',
-                queryset=User.objects.add_user_annotation(user.id)
-            )
-        ).get(id=instance.id)
-        serializer = RecipeSerializer(recipe, context=self.context)
-        return serializer.data
+        """Ответ из записанных данных и одного чтения ингредиентов."""
+        tags = getattr(self, 'written_tags', None)
+        if tags is not None:
+            tags = {
+                instance.pk: [
+                    tag_row(tag) for tag in sorted(tags, key=attrgetter('pk'))
+                ]
+            }
+        return FastRecipeSerializer(
+            context=self.context
+        ).represent_many([recipe_row(instance)], tags)[0]
 
     class Meta:
         model = Recipe
@@ -228,6 +393,7 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField()
     name = serializers.CharField()
     image = Base64ImageField(required=False)
+    image_variants = ImageVariantsField()
     cooking_time = serializers.IntegerField()
 
     def create(self, validated_data):
@@ -241,27 +407,16 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = (
-            'id', 'name', 'image', 'cooking_time',
+            'id', 'name', 'image', 'image_variants', 'cooking_time',
         )
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
     """Сериализация подписок"""
-    is_subscribed = serializers.BooleanField()
-    recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
-
-    def get_recipes(self, obj):
-        if ('recipes_limit' in self.context
-           and self.context['recipes_limit'] is not None):
-            limit = int(self.context['recipes_limit'])
-            queryset = obj.recipe_author.all()[:limit]
-            return ShoppingCartSerializer(queryset, many=True).data
-        queryset = obj.recipe_author.all()
-        return ShoppingCartSerializer(queryset, many=True).data
-
-    def get_recipes_count(self, obj):
-        return obj.recipe_author.all().count()
+    is_subscribed = RelationField('subscriptions')
+    recipes = ShoppingCartSerializer(
+        source='recipe_previews', many=True, read_only=True
+    )
 
     class Meta:
         model = User
@@ -277,54 +432,17 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         )
 
 
-class FavorSerializer(serializers.ModelSerializer):
-    """Сериализация добавления рецепта в избранное"""
+class RecipesLimitSerializer(serializers.Serializer):
+    """Проверка параметра recipes_limit для подписок"""
+    max_recipes_limit = 100
 
-    def create(self, validated_data):
-        if FavorRecipe.objects.filter(
-            user=validated_data['user'],
-            recipe=validated_data['recipe']
-        ).exists():
-            raise serializers.ValidationError("Already favorited.")
-        return super().create(validated_data)
-
-    class Meta:
-        model = FavorRecipe
-        fields = '__all__'
+    recipes_limit = serializers.IntegerField(min_value=0, required=False)
 
+    def validate_recipes_limit(self, value):
+        return min(value, self.max_recipes_limit)
 
-class ShoppingSerializer(serializers.ModelSerializer):
-    """Сериализация добавления рецепта в корзину"""
-    def create(self, validated_data):
-        if ShoppingCart.objects.filter(
-            user=validated_data['user'],
-            recipe=validated_data['recipe']
-        ).exists():
-            raise serializers.ValidationError("Already in shopping cart.")
-        return super().create(validated_data)
-
-    class Meta:
-        model = ShoppingCart
-        fields = '__all__'
-
-
-class SubSerializer(serializers.ModelSerializer):
-    """Сериализация создания подписки"""
-
-    def create(self, validated_data):
-        user = validated_data['user']
-        subscribe_to = validated_data['subscribe_to']
-        if UserSubscription.objects.filter(
-            user=user,
-            subscribe_to=subscribe_to
-        ).exists():
-            raise serializers.ValidationError('Already subscribed.')
-        if user == subscribe_to:
-            raise serializers.ValidationError(
-                "You can't subscribe to yourself"
-            )
-        return super().create(validated_data)
-
-    class Meta:
-        model = UserSubscription
-        fields = '__all__'
+    @property
+    def limit(self):
+        return self.validated_data.get(
+            'recipes_limit', self.max_recipes_limit
+        )
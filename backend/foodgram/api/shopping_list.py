@@ -0,0 +1,119 @@
+import csv
+import tempfile
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+FILENAME = 'products'
+CSV_HEADER = ('Ингредиент', 'Единица измерения', 'Количество')
+CHUNK_SIZE = 2000
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+
+
+class Echo:
+    """Псевдо-буфер: csv.writer пишет в него, а строка сразу уходит
+    в ответ."""
+
+    def write(self, value):
+        return value
+
+
+def iter_txt(ingredients):
+    for ingredient in ingredients:
+        yield (
+            f"{ingredient['ingredient__name']} "
+            f"({ingredient['ingredient__measurement_unit']}) - "
+            f"{ingredient['total_amount']}\n"
+        )
+
+
+def iter_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['total_amount'],
+        ))
+
+
+def write_pdf(ingredients, file):
+    """Пишет PDF построчно в file, не собирая список в памяти."""
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
+        )
+    height = A4[1]
+    pdf = canvas.Canvas(file, pagesize=A4)
+    pdf.setTitle('Список покупок')
+    y = height - PDF_MARGIN
+    for line in iter_txt(ingredients):
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            y = height - PDF_MARGIN
+        pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+        pdf.drawString(PDF_MARGIN, y, line.rstrip('\n'))
+        y -= PDF_LINE_HEIGHT
+    pdf.save()
+
+
+def txt_response(ingredients):
+    response = StreamingHttpResponse(
+        iter_txt(ingredients), content_type='text/plain; charset=utf-8'
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename={FILENAME}.txt'
+    )
+    return response
+
+
+def csv_response(ingredients):
+    response = StreamingHttpResponse(
+        iter_csv(ingredients), content_type='text/csv; charset=utf-8'
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename={FILENAME}.csv'
+    )
+    return response
+
+
+def pdf_response(ingredients):
+    # PDF нельзя отдавать по мере генерации: таблица ссылок пишется
+    # в конце файла. Поэтому большой документ сбрасывается на диск,
+    # а в ответ уходит потоком.
+    file = tempfile.SpooledTemporaryFile(
+        max_size=settings.SHOPPING_LIST_PDF_SPOOL_SIZE
+    )
+    write_pdf(ingredients, file)
+    file.seek(0)
+    return FileResponse(
+        file,
+        as_attachment=True,
+        filename=f'{FILENAME}.pdf',
+        content_type='application/pdf',
+    )
+
+
+RESPONSES = {
+    'txt': txt_response,
+    'csv': csv_response,
+    'pdf': pdf_response,
+}
+
+
+def shopping_list_response(ingredients, file_format):
+    """Ответ со списком покупок в формате file_format.
+
+    ingredients — queryset строк со значениями ``ingredient__name``,
+    ``ingredient__measurement_unit`` и ``total_amount``. Он читается
+    через iterator(), т.е. серверным курсором и кусками по CHUNK_SIZE.
+    """
+    return RESPONSES[file_format](ingredients.iterator(CHUNK_SIZE))
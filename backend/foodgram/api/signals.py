@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from foodgram.db import change_counter
+from recipes.models import Ingredient, IngredientsAmount, Recipe, Tag
+from recipes.signals import recipe_changed
+from users.models import User
+
+from .cache import (INGREDIENTS_CACHE_KEY, RECIPES_GENERATION_KEY,
+                    TAG_IDS_CACHE_KEY, TAGS_CACHE_KEY, bump_generation,
+                    invalidate)
+from .fast_serializers import USER_COLUMNS
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    invalidate(INGREDIENTS_CACHE_KEY)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    invalidate(TAGS_CACHE_KEY, TAG_IDS_CACHE_KEY)
+
+
+@receiver(post_save, sender=Recipe)
+def count_created_recipe(instance, created, **kwargs):
+    if created:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(instance, **kwargs):
+    change_counter(
+        User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+    )
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=IngredientsAmount)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(recipe_changed, sender=Recipe)
+def invalidate_recipes(**kwargs):
+    # После коммита: иначе анонимный запрос до коммита прочитает старые
+    # строки и закэширует их уже под новым поколением.
+    transaction.on_commit(lambda: bump_generation(RECIPES_GENERATION_KEY))
+
+
+@receiver(post_save, sender=User)
+def invalidate_recipes_on_author_change(
+    instance, created, update_fields=None, **kwargs
+):
+    """Сброс, если изменились публичные поля автора рецептов.
+
+    Новые пользователи, вход (last_login) и смена пароля ответы
+    с рецептами не меняют. Удаление автора удаляет и его рецепты,
+    их сигналы сбрасывают кэш сами.
+    """
+    if created:
+        return
+    if update_fields is not None and not set(update_fields) & set(
+        USER_COLUMNS
+    ):
+        return
+    if Recipe.objects.filter(author=instance).exists():
+        invalidate_recipes()
@@ -1,25 +1,48 @@
-from django.db.models import Prefetch, Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import F, Prefetch, prefetch_related_objects
 from django.shortcuts import get_object_or_404
+from django_filters.rest_framework import DjangoFilterBackend
+from foodgram.db import change_counter
 from recipes.models import (FavorRecipe, Ingredient, IngredientsAmount, Recipe,
-                            Tag)
+                            ShoppingCart, ShoppingListItem, Tag,
+                            normalize_search_key)
 from rest_framework import status, viewsets
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.decorators import action
 from rest_framework.filters import SearchFilter
-from rest_framework.permissions import (AllowAny, IsAdminUser, IsAuthenticated,
+from rest_framework.permissions import (SAFE_METHODS, AllowAny, IsAdminUser,
+                                        IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 from users.models import User, UserSubscription
 
-from .filters import RecipeFilter
+from .cache import (INGREDIENTS_CACHE_KEY, RECIPES_GENERATION_KEY,
+                    TAGS_CACHE_KEY, AnonymousCacheMixin, CachedListMixin)
+from .fast_serializers import (RECIPE_COLUMNS, USER_COLUMNS,
+                               FastRecipeSerializer, FastUserSerializer)
+from .filters import ExplicitOrderingFilter, RecipeFilter
 from .pagination import PageAndLimitPagination
 from .permissions import IsAuthorAdminOrReadOnly
-from .serializers import (ChangePasswordSerializer, FavorSerializer,
+from .relations import invalidate_relations
+from .renderers import (CSVRenderer, PDFRenderer, PlainTextRenderer,
+                        get_json_renderer_class)
+from .serializers import (ChangePasswordSerializer, IngredientSearchSerializer,
                           IngredientSerializer, RecipeSerializer,
-                          RecipeWriteSerializer, ShoppingCartSerializer,
-                          ShoppingSerializer, SubscriptionSerializer,
-                          SubSerializer, TagSerializer, UserSerializer)
+                          RecipesLimitSerializer, RecipeWriteSerializer,
+                          ShoppingCartSerializer, SubscriptionSerializer,
+                          TagSerializer, UserCreateSerializer, UserSerializer)
+from .shopping_list import RESPONSES, shopping_list_response
+
+
+def is_fast_read(view):
+    """list и retrieve отдаются из строк .values() (api.fast_serializers).
+
+    Формы browsable API запрашивают сериализатор с другим методом,
+    им достаются обычные модели и сериализаторы.
+    """
+    return (
+        view.action in ('list', 'retrieve')
+        and view.request.method in SAFE_METHODS
+    )
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -29,6 +52,7 @@ class UserViewSet(viewsets.ModelViewSet):
     filter_backends = (SearchFilter,)
     search_fields = ('username',)
     lookup_field = 'id'
+    lookup_value_regex = r'\d+'
 
     def get_permissions(self):
         if self.action in ['list', 'create']:
@@ -38,20 +62,26 @@ class UserViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
 
     def get_queryset(self):
-        queryset = User.objects.add_user_annotation(self.request.user.id)
-        return queryset
+        if is_fast_read(self):
+            return User.objects.values(*USER_COLUMNS)
+        return User.objects.all()
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return UserCreateSerializer
+        if is_fast_read(self):
+            return FastUserSerializer
+        return super().get_serializer_class()
 
     @action(
         detail=False,
         methods=('GET',),
         url_path='me',
-        authentication_classes=[TokenAuthentication, ],
         permission_classes=(IsAuthenticated,),
     )
     def me(self, request):
         """Профайл пользователя."""
         user = request.user
-        user.is_subscribed = False
         serializer = UserSerializer(
             user,
             context={
@@ -86,18 +116,10 @@ class UserViewSet(viewsets.ModelViewSet):
     )
     def subscriptions(self, request):
         """Пользователи, на которых подписан текущий пользователь"""
-        recipes_limit = request.GET.get('recipes_limit', None)
         user = request.user
-        queryset = user.subscription.add_user_annotation(user.id).all()
-        page = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(
-            page,
-            many=True,
-            context={
-                'request': request,
-                'recipes_limit': recipes_limit,
-            }
-        )
+        page = self.paginate_queryset(user.subscription.all())
+        self.with_recipes(page)
+        serializer = self.get_serializer(page, many=True)
         return self.get_paginated_response(serializer.data)
 
     @action(
@@ -110,136 +132,200 @@ class UserViewSet(viewsets.ModelViewSet):
     def subscribe(self, request, id):
         """Текущий пользователь подписывается на пользователя с id"""
         user = request.user
-        recipes_limit = request.GET.get('recipes_limit', None)
-        subscribe_to = self.get_object()
-        serializer = SubSerializer(
-            data={
-                'user': user.id,
-                'subscribe_to': subscribe_to.id,
-            },
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        user.subscription.add(subscribe_to)
-        subscribe_to = (
-            User.objects.add_user_annotation(user).get(
-                id=subscribe_to.id
+        subscribe_to = get_object_or_404(User, id=id)
+        self.with_recipes([subscribe_to])
+        if subscribe_to.pk == user.pk:
+            return Response(
+                ["You can't subscribe to yourself"],
+                status=status.HTTP_400_BAD_REQUEST
             )
-        )
+        with transaction.atomic():
+            if not UserSubscription.objects.insert_or_ignore(
+                user=user, subscribe_to=subscribe_to
+            ):
+                return Response(
+                    ['Already subscribed.'],
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            change_counter(
+                User.objects.filter(pk=subscribe_to.pk), 'followers_count', 1
+            )
+        invalidate_relations(request)
         serializer = SubscriptionSerializer(
             subscribe_to,
-            context={
-                'recipes_limit': recipes_limit
-            }
+            context={'request': request}
         )
         return Response(
             data=serializer.data, status=status.HTTP_201_CREATED
         )
 
+    def with_recipes(self, authors):
+        """Превью recipes_limit первых рецептов авторов одним запросом."""
+        params = RecipesLimitSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        prefetch_related_objects(
+            authors,
+            Prefetch(
+                'recipe_author',
+                queryset=Recipe.objects.first_by_author(
+                    authors, params.limit
+                ),
+                to_attr='recipe_previews',
+            ),
+        )
+
     @subscribe.mapping.delete
     def delete_subscribe(self, request, id):
         """Текущий пользователь удаляет подписку на пользователя с id"""
-        user = request.user
-        subscribe_to = self.get_object()
-        if not UserSubscription.objects.filter(
-            user=user,
-            subscribe_to=subscribe_to
-        ).exists():
+        with transaction.atomic():
+            deleted = UserSubscription.objects.delete_matching(
+                user=request.user, subscribe_to=id
+            )
+            change_counter(
+                User.objects.filter(pk=id), 'followers_count', -deleted
+            )
+        invalidate_relations(request)
+        if not deleted:
+            get_object_or_404(User, id=id)
             return Response(
-                {'You are not subscribed to this user'},
+                ['You are not subscribed to this user'],
                 status=status.HTTP_400_BAD_REQUEST
             )
-        user.subscription.remove(subscribe_to)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(CachedListMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
+    authentication_classes = ()
     permission_classes = (
         AllowAny,
     )
+    list_cache_key = TAGS_CACHE_KEY
     serializer_class = TagSerializer
     http_method_names = ['get', ]
     pagination_class = None
     lookup_field = 'id'
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(CachedListMixin, viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
+    authentication_classes = ()
     permission_classes = (
         AllowAny,
     )
+    list_cache_key = INGREDIENTS_CACHE_KEY
     http_method_names = ['get', ]
     pagination_class = None
     lookup_field = 'id'
 
-    def get_queryset(self):
-        queryset = Ingredient.objects.all()
-        keyword = self.request.GET.get('name',)
-        if keyword:
-            queryset = queryset.filter(name__istartswith=keyword)
-        return queryset
+    def list(self, request, *args, **kwargs):
+        """Весь справочник или поиск по ?name=.
+
+        name, пустой после normalize_search_key (например, из одних
+        пробелов), — то же, что отсутствие параметра.
+        """
+        params = IngredientSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        name = params.validated_data.get('name')
+        if not name or not normalize_search_key(name):
+            return super().list(request, *args, **kwargs)
+        ingredients = Ingredient.objects.search(
+            name, params.validated_data.get('limit')
+        )
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
 
 
-class RecipesViewSet(viewsets.ModelViewSet):
+class RecipesViewSet(AnonymousCacheMixin, viewsets.ModelViewSet):
     serializer_class = RecipeSerializer
     permission_classes = (
         IsAuthenticatedOrReadOnly,
         IsAuthorAdminOrReadOnly,
     )
     pagination_class = PageAndLimitPagination
+    filter_backends = (DjangoFilterBackend, ExplicitOrderingFilter)
     filterset_class = (RecipeFilter)
+    ordering_fields = ('id', 'favorites_count', 'in_cart_count')
+    ordering = ('id',)
+    generation_key = RECIPES_GENERATION_KEY
     http_method_names = ['post', 'get', 'patch', 'delete', ]
     lookup_field = 'id'
+    lookup_value_regex = r'\d+'
 
     def get_queryset(self):
-        queryset = Recipe.objects.add_user_annotation(
-            self.request.user.id
-        ).prefetch_related(
-            Prefetch(
-                'author',
-                queryset=User.objects.add_user_annotation(self.request.user.id)
-            )
-        )
-        return queryset
+        if is_fast_read(self):
+            # Курсорной пагинации позиция нужна из колонки сортировки;
+            # в ответ FastRecipeSerializer берёт только RECIPE_COLUMNS.
+            return Recipe.objects.values(*RECIPE_COLUMNS, *(
+                field for field in self.ordering_fields
+                if field not in RECIPE_COLUMNS
+            ))
+        if self.action in ('update', 'partial_update', 'destroy'):
+            # Ответ записи собирается без prefetch (RecipeWriteSerializer).
+            return Recipe.objects.select_related('author')
+        return Recipe.objects.prefetch_for_read()
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update', ]:
             return RecipeWriteSerializer
+        if is_fast_read(self):
+            return FastRecipeSerializer
         return RecipeSerializer
 
     def perform_create(self, serializer):
-        user = self.request.user
-        user = User.objects.add_user_annotation(user).get(id=user.id)
         serializer.save(
-            author=user,
+            author=self.request.user,
         )
 
+    def perform_destroy(self, instance):
+        user_ids = list(
+            instance.shopping_carts.values_list('id', flat=True)
+        )
+        ingredient_ids = list(
+            instance.ingredients.values_list('id', flat=True)
+        )
+        instance.delete()
+        if user_ids:
+            ShoppingListItem.objects.refresh(user_ids, ingredient_ids)
+
     @action(
         detail=False,
         methods=("GET",),
         url_path="download_shopping_cart",
         permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            get_json_renderer_class(), PlainTextRenderer, CSVRenderer,
+            PDFRenderer,
+        ),
     )
     def download_shopping_cart(self, request):
-        """Скачать файл со списком покупок."""
-        ingredients = IngredientsAmount.objects.filter(
-            recipe__shopping_carts__username=request.user
-        ).values('ingredient__name', 'ingredient__measurement_unit').annotate(
-            total_amount=Sum('amount')
-        )
-        text = ''
-        for ingredient in ingredients:
-            text += (
-                f"{ingredient['ingredient__name']} "
-                f"({ingredient['ingredient__measurement_unit']}) - "
-                f"{ingredient['total_amount']}\n"
+        """Скачать файл со списком покупок (?file_format=txt|csv|pdf).
+
+        Без параметра формат берётся из заголовка Accept или ?format,
+        по умолчанию txt. ?format с неизвестным значением DRF
+        отклоняет ещё при выборе рендерера, поэтому свой параметр.
+        """
+        file_format = request.accepted_renderer.format
+        if file_format not in RESPONSES:
+            file_format = 'txt'
+        file_format = request.query_params.get('file_format', file_format)
+        if file_format not in RESPONSES:
+            return Response(
+                {
+                    'file_format':
+                        f'Available formats: {", ".join(RESPONSES)}'
+                },
+                status=status.HTTP_400_BAD_REQUEST
             )
-        filename = 'products.txt'
-        response = HttpResponse(text, content_type='text/plain')
-        response['Content-Disposition'] = f'attachement; filename={filename}'
-        return response
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
+        ).values(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            total_amount=F('amount'),
+        ).order_by('ingredient__name', 'ingredient__measurement_unit')
+        return shopping_list_response(ingredients, file_format)
 
     @action(
         detail=True,
@@ -250,17 +336,19 @@ class RecipesViewSet(viewsets.ModelViewSet):
     )
     def favorite(self, request, id):
         """Текущий пользователь добавляет рецепт в избранное по id"""
-        user = request.user
-        recipe = self.get_object()
-        serializer = FavorSerializer(
-            data={
-                'recipe': recipe.id,
-                'user': user.id,
-            }
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        recipe.favorites.add(user)
+        recipe = get_object_or_404(Recipe, id=id)
+        with transaction.atomic():
+            if not FavorRecipe.objects.insert_or_ignore(
+                user=request.user, recipe=recipe
+            ):
+                return Response(
+                    ['Already favorited.'],
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            change_counter(
+                Recipe.objects.filter(pk=recipe.pk), 'favorites_count', 1
+            )
+        invalidate_relations(request)
         serializer = ShoppingCartSerializer(recipe)
         return Response(
             data=serializer.data, status=status.HTTP_201_CREATED
@@ -269,14 +357,20 @@ class RecipesViewSet(viewsets.ModelViewSet):
     @favorite.mapping.delete
     def delete_favorite(self, request, id):
         """Текущий пользователь удаляет рецепт из избранного по id"""
-        user = request.user
-        recipe = self.get_object()
-        if not FavorRecipe.objects.filter(user=user, recipe=recipe).exists():
+        with transaction.atomic():
+            deleted = FavorRecipe.objects.delete_matching(
+                user=request.user, recipe=id
+            )
+            change_counter(
+                Recipe.objects.filter(pk=id), 'favorites_count', -deleted
+            )
+        invalidate_relations(request)
+        if not deleted:
+            get_object_or_404(Recipe, id=id)
             return Response(
-                {'This recipe is not in your favorites'},
+                ['This recipe is not in your favorites'],
                 status=status.HTTP_400_BAD_REQUEST
             )
-        recipe.favorites.remove(user)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -288,16 +382,22 @@ class RecipesViewSet(viewsets.ModelViewSet):
     def shopping_cart(self, request, id):
         """Текущий пользователь добавляет рецепт в корзину по id"""
         user = request.user
-        recipe = self.get_object()
-        serializer = ShoppingSerializer(
-            data={
-                'recipe': recipe.id,
-                'user': user.id,
-            }
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        recipe.shopping_carts.add(user)
+        recipe = get_object_or_404(Recipe, id=id)
+        with transaction.atomic():
+            if not ShoppingCart.objects.insert_or_ignore(
+                user=user, recipe=recipe
+            ):
+                return Response(
+                    ['Already in shopping cart.'],
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            change_counter(
+                Recipe.objects.filter(pk=recipe.pk), 'in_cart_count', 1
+            )
+            ShoppingListItem.objects.refresh(
+                [user.id], recipe.ingredients.values_list('id', flat=True)
+            )
+        invalidate_relations(request)
         serializer = ShoppingCartSerializer(recipe)
         return Response(
             data=serializer.data,
@@ -308,10 +408,25 @@ class RecipesViewSet(viewsets.ModelViewSet):
     def delete_from_shopping_cart(self, request, id):
         """Текущий пользователь удаляет рецепт из корзины по id"""
         user = request.user
-        recipe = get_object_or_404(Recipe, id=self.kwargs.get('id'))
-        if recipe not in user.in_shopping_cart_recipes.all():
+        with transaction.atomic():
+            deleted = ShoppingCart.objects.delete_matching(
+                user=user, recipe=id
+            )
+            if deleted:
+                change_counter(
+                    Recipe.objects.filter(pk=id), 'in_cart_count', -deleted
+                )
+                ShoppingListItem.objects.refresh(
+                    [user.id],
+                    IngredientsAmount.objects.filter(
+                        recipe=id
+                    ).values_list('ingredient', flat=True)
+                )
+        invalidate_relations(request)
+        if not deleted:
+            get_object_or_404(Recipe, id=id)
             return Response(
-                {'This recipe is not in your shopping cart'},
-                status=status.HTTP_400_BAD_REQUEST)
-        recipe.shopping_carts.remove(user)
+                ['This recipe is not in your shopping cart'],
+                status=status.HTTP_400_BAD_REQUEST
+            )
         return Response(status=status.HTTP_204_NO_CONTENT)
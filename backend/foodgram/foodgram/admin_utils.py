@@ -0,0 +1,55 @@
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+
+from .db import count_rows
+from .paginator import EstimatedPaginator
+
+
+class EstimatedCountPaginator(EstimatedPaginator):
+    """Пагинатор, который не считает большие таблицы точно.
+
+    Если планировщик оценивает выборку больше чем в exact_count_limit
+    строк, число страниц берётся из оценки вместо COUNT(*), а сами
+    страницы за пределами оценки всё равно открываются.
+    """
+
+    exact_count_limit = 10000
+
+    def count_rows(self):
+        return count_rows(self.object_list, self.exact_count_limit)
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """Формсет инлайна, который показывает одну страницу строк."""
+
+    per_page = 20
+    request = None
+
+    @property
+    def page_param(self):
+        return f'{self.prefix}-page'
+
+    def get_queryset(self):
+        if not hasattr(self, 'page'):
+            queryset = super().get_queryset()
+            self.page = Paginator(queryset, self.per_page).get_page(
+                self.request.GET.get(self.page_param)
+                if self.request is not None else None
+            )
+            self._queryset = self.page.object_list
+        return self._queryset
+
+
+class PaginatedTabularInline(admin.TabularInline):
+    """Табличный инлайн с постраничным выводом существующих строк."""
+
+    formset = PaginatedInlineFormSet
+    per_page = 20
+    template = 'admin/edit_inline/paginated_tabular.html'
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.request = request
+        formset.per_page = self.per_page
+        return formset
@@ -0,0 +1,102 @@
+import json
+
+from django.db import connections, models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+class UniqueRelationQuerySet(models.QuerySet):
+    """Вставка и удаление строк связи одним запросом.
+
+    Модель должна иметь уникальное ограничение на набор полей, по
+    которому идёт вставка, иначе повтор не будет распознан. Поля
+    передаются по имени, значения — объектами или их pk.
+    """
+
+    def _execute(self, template, fields):
+        opts = self.model._meta
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        columns = [quote(opts.get_field(name).column) for name in fields]
+        sql = template.format(
+            table=quote(opts.db_table),
+            columns=', '.join(columns),
+            values=', '.join(['%s'] * len(columns)),
+            where=' AND '.join(f'{column} = %s' for column in columns),
+        )
+        values = [getattr(value, 'pk', value) for value in fields.values()]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, values)
+            return cursor.rowcount
+
+    def insert_or_ignore(self, **fields):
+        """Добавляет строку; False, если такая уже есть."""
+        return self._execute(
+            'INSERT INTO {table} ({columns}) VALUES ({values}) '
+            'ON CONFLICT DO NOTHING',
+            fields,
+        ) == 1
+
+    def delete_matching(self, **fields):
+        """Удаляет строки с такими значениями; возвращает их число."""
+        return self._execute('DELETE FROM {table} WHERE {where}', fields)
+
+
+def change_counter(queryset, field, delta):
+    """Сдвигает счётчик field у строк queryset на delta одним UPDATE.
+
+    Счётчик не уходит ниже нуля, даже если успел разойтись с данными
+    (его чинит команда reconcile_counters).
+    """
+    if delta > 0:
+        queryset.update(**{field: F(field) + delta})
+    elif delta < 0:
+        queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def count_subquery(model, field, **filters):
+    """Число строк model, у которых field ссылается на внешний pk.
+
+    filters — дополнительные условия на строки, например
+    user__isnull=False для связей, которые переживают удаление
+    пользователя (SET_NULL).
+    """
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')}, **filters
+            ).order_by().values(field).annotate(
+                count=Count('pk')
+            ).values('count')
+        ),
+        0,
+    )
+
+
+def estimate_count(queryset):
+    """Оценка числа строк queryset по плану запроса PostgreSQL.
+
+    На других СУБД оценки нет, возвращается None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_rows(queryset, exact_count_limit):
+    """Число строк queryset и признак того, что оно точное.
+
+    Если планировщик оценивает выборку не меньше чем в
+    exact_count_limit строк, возвращается оценка вместо COUNT(*).
+    """
+    estimate = estimate_count(queryset)
+    if estimate is not None and estimate >= exact_count_limit:
+        return estimate, False
+    return queryset.count(), True
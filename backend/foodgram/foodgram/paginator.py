@@ -0,0 +1,65 @@
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.utils.functional import cached_property
+
+
+class EstimatedPage(Page):
+    """Страница, у которой следующая определяется по лишней строке."""
+
+    has_more = False
+
+    def has_next(self):
+        return self.has_more
+
+    def end_index(self):
+        return (self.number - 1) * self.paginator.per_page + len(self)
+
+
+class EstimatedPaginator(Paginator):
+    """Пагинатор, число строк которого может быть оценкой.
+
+    Наследники возвращают из count_rows() пару (число, точное ли оно).
+    Если число оценочное, номер страницы по нему не проверяется:
+    страница читается с одной лишней строкой, и по ней же решается,
+    есть ли следующая. Пустой оказывается только страница за реальным
+    концом выборки.
+    """
+
+    def count_rows(self):
+        return super().count, True
+
+    @cached_property
+    def counted(self):
+        return self.count_rows()
+
+    @property
+    def count(self):
+        return self.counted[0]
+
+    @property
+    def count_exact(self):
+        return self.counted[1]
+
+    def validate_number(self, number):
+        if self.count_exact:
+            return super().validate_number(number)
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_exact:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('That page contains no results')
+        page = EstimatedPage(rows[:self.per_page], number, self)
+        page.has_more = len(rows) > self.per_page
+        return page
@@ -29,6 +29,33 @@ INSTALLED_APPS = [
     'users',
 ]
 
+# Проверка токена: 'db' — запрос к таблице токенов на каждый запрос,
+# 'cached' — кэш токенов в памяти процесса (users.authentication).
+# Выход из аккаунта в другом воркере виден с задержкой до
+# AUTH_TOKEN_CACHE_TIMEOUT секунд.
+AUTH_TOKEN_MODES = {
+    'db': 'rest_framework.authentication.TokenAuthentication',
+    'cached': 'users.authentication.CachedTokenAuthentication',
+}
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', default=10000))
+AUTH_TOKEN_CACHE_TIMEOUT = int(
+    os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', default=60)
+)
+
+# JSON в API: 'fast' — orjson (api.renderers, api.parsers), без
+# установленного orjson сам откатывается на стандартный json;
+# 'stdlib' — рендерер и парсер DRF.
+API_JSON_MODES = {
+    'fast': ('api.renderers.FastJSONRenderer', 'api.parsers.FastJSONParser'),
+    'stdlib': (
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.parsers.JSONParser',
+    ),
+}
+API_JSON_RENDERER, API_JSON_PARSER = API_JSON_MODES[
+    os.getenv('API_JSON', default='fast')
+]
+
 REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 6,
@@ -36,7 +63,16 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        AUTH_TOKEN_MODES[os.getenv('AUTH_TOKEN_MODE', default='db')],
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        API_JSON_RENDERER,
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        API_JSON_PARSER,
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -91,6 +127,46 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+# Ингредиенты и теги сбрасываются из кэша сигналами при изменении.
+# С LocMemCache сброс виден только текущему процессу, поэтому таймаут
+# ограничивает время, которое другие воркеры могут отдавать старые
+# данные. Для нескольких воркеров лучше общий кэш (Redis/Memcached).
+REFERENCE_DATA_CACHE_TIMEOUT = int(
+    os.getenv('REFERENCE_DATA_CACHE_TIMEOUT', default=300)
+)
+
+# Ответы списка и карточки рецептов для анонимов; сбрасываются
+# сигналами, таймаут ограничивает устаревание в других процессах.
+ANONYMOUS_CACHE_TIMEOUT = int(
+    os.getenv('ANONYMOUS_CACHE_TIMEOUT', default=60)
+)
+# Наборы избранного, корзины и подписок пользователя; сбрасываются
+# переключателями в API, таймаут ограничивает устаревание в других
+# процессах и после правок в админке.
+USER_RELATIONS_CACHE_TIMEOUT = int(
+    os.getenv('USER_RELATIONS_CACHE_TIMEOUT', default=300)
+)
+
+# Число строк в постраничных ответах кэшируется для каждой комбинации
+# фильтров; выборки больше PAGINATION_EXACT_COUNT_LIMIT строк считаются
+# по оценке планировщика PostgreSQL.
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', default=30)
+)
+PAGINATION_EXACT_COUNT_LIMIT = int(
+    os.getenv('PAGINATION_EXACT_COUNT_LIMIT', default=10000)
+)
+
 AUTH_USER_MODEL = 'users.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -128,6 +204,16 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+DEFAULT_FILE_STORAGE = 'recipes.storage.ContentAddressedStorage'
+
+# Потоки, в которых строятся уменьшенные копии картинок рецептов.
+IMAGE_VARIANTS_WORKERS = int(os.getenv('IMAGE_VARIANTS_WORKERS', default=2))
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+SHOPPING_LIST_PDF_SPOOL_SIZE = 1024 * 1024
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
@@ -1,7 +1,12 @@
 from django.contrib import admin
+from django.db.models import Q
+from foodgram.admin_utils import (EstimatedCountPaginator,
+                                  PaginatedTabularInline)
+from foodgram.db import count_subquery
+from users.models import User
 
 from .models import (FavorRecipe, Ingredient, IngredientsAmount, Recipe,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag, normalize_search_key)
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -23,24 +28,37 @@ class IngredientAdmin(admin.ModelAdmin):
     ]
     list_display_links = ('id', 'name',)
     empty_value_display = '-пусто-'
-    list_filter = (
-        'name',
-    )
+    search_fields = ('name',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по началу названия через индекс search_name."""
+        if not search_term:
+            return queryset, False
+        return queryset.filter(
+            search_name__startswith=normalize_search_key(search_term)
+        ), False
 
 
 class IngredientsAmountInline(admin.TabularInline):
     model = IngredientsAmount
     extra = 1
     min_num = 1
+    autocomplete_fields = ('ingredient',)
     verbose_name = "Ингредиент и количество"
 
 
-class FavorRecipeInline(admin.TabularInline):
+class FavorRecipeInline(PaginatedTabularInline):
     model = FavorRecipe
+    extra = 0
+    autocomplete_fields = ('user',)
 
 
-class ShoppingCartInline(admin.TabularInline):
+class ShoppingCartInline(PaginatedTabularInline):
     model = ShoppingCart
+    extra = 0
+    autocomplete_fields = ('user',)
 
 
 class RecipeAdmin(admin.ModelAdmin):
@@ -59,23 +77,94 @@ class RecipeAdmin(admin.ModelAdmin):
         'get_tags',
     ]
     list_display_links = ('id', 'name',)
+    list_select_related = ('author',)
+    autocomplete_fields = ('author',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('tags')
 
     @admin.display(description='Теги')
     def get_tags(self, obj):
-        if obj.tags.all():
-            return list(obj.tags.all().values_list('name', flat=True))
+        return [tag.name for tag in obj.tags.all()] or None
 
+    @admin.display(
+        description='Число добавлений в избранное',
+        ordering='favorites_count',
+    )
     def favorite_count(self, obj):
-        return obj.favorites.count()
-    favorite_count.short_description = 'Число добавлений в избранное'
+        return obj.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        recipe = form.instance
+        ingredient_ids = set(
+            recipe.ingredients.values_list('id', flat=True)
+        ) if change else set()
+        super().save_related(request, form, formsets, change)
+        self.refresh_shopping_lists(recipe, formsets, ingredient_ids)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            favorites_count=count_subquery(
+                FavorRecipe, 'recipe', user__isnull=False
+            ),
+            in_cart_count=count_subquery(
+                ShoppingCart, 'recipe', user__isnull=False
+            ),
+        )
+
+    @staticmethod
+    def refresh_shopping_lists(recipe, formsets, ingredient_ids):
+        """Пересчёт списков покупок после правки в инлайнах.
+
+        ingredient_ids — ингредиенты рецепта до сохранения: строки
+        удалённых ингредиентов тоже нужно пересчитать.
+        """
+        user_ids = set()
+        ingredients_changed = False
+        for formset in formsets:
+            if formset.model is IngredientsAmount:
+                ingredients_changed = formset.has_changed()
+            elif formset.model is ShoppingCart:
+                for inline_form in formset.forms:
+                    if inline_form.has_changed():
+                        user_ids.add(inline_form.initial.get('user'))
+                        user_ids.add(getattr(
+                            inline_form.cleaned_data.get('user'), 'pk', None
+                        ))
+        user_ids.discard(None)
+        if ingredients_changed:
+            user_ids.update(
+                recipe.shopping_carts.values_list('id', flat=True)
+            )
+        if user_ids:
+            ingredient_ids |= set(
+                recipe.ingredients.values_list('id', flat=True)
+            )
+            ShoppingListItem.objects.refresh(user_ids, ingredient_ids)
 
     empty_value_display = '-пусто-'
+    search_fields = ('name', 'author__username')
     list_filter = (
-        'author',
-        'name',
         'tags',
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по началу названия или юзернейма автора через индексы.
+
+        Авторы отбираются подзапросом по author_id, без соединения
+        таблиц. В отличие от ингредиентов, у которых есть
+        нормализованная колонка search_name, поиск учитывает регистр,
+        как и поиск пользователей.
+        """
+        if not search_term:
+            return queryset, False
+        return queryset.filter(
+            Q(name__startswith=search_term)
+            | Q(author__in=User.objects.filter(
+                username__startswith=search_term
+            ).values('pk'))
+        ), False
+
 
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
@@ -0,0 +1,120 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps, features
+
+from .models import Recipe
+from .signals import recipe_changed
+
+logger = logging.getLogger(__name__)
+
+# Ширина уменьшенных копий картинки рецепта.
+VARIANT_WIDTHS = {
+    'card': 480,
+    'card_2x': 960,
+    'detail': 1200,
+}
+VARIANTS_DIR = 'variants'
+QUALITY = 82
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_VARIANTS_WORKERS,
+            thread_name_prefix='image-variants',
+        )
+    return _executor
+
+
+def _formats():
+    formats = [('JPEG', 'jpg')]
+    if features.check('webp'):
+        formats.append(('WEBP', 'webp'))
+    return formats
+
+
+def _encode(image, image_format):
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=QUALITY, optimize=True)
+    return ContentFile(buffer.getvalue())
+
+
+def build_variants(name):
+    """Сохраняет уменьшенные копии картинки name.
+
+    Возвращает {вариант: {расширение: имя файла в хранилище}}.
+    Картинка не увеличивается: для узких оригиналов вариант
+    совпадает по размеру с исходником.
+    """
+    with default_storage.open(name) as file:
+        original = ImageOps.exif_transpose(Image.open(file))
+        original.load()
+    stem = os.path.splitext(os.path.basename(name))[0]
+    variants = {}
+    for label, width in VARIANT_WIDTHS.items():
+        image = original
+        if original.width > width:
+            height = round(original.height * width / original.width)
+            image = original.resize((width, height), Image.LANCZOS)
+        variants[label] = {
+            extension: default_storage.save(
+                f'{VARIANTS_DIR}/{stem}_{label}.{extension}',
+                _encode(image, image_format),
+            )
+            for image_format, extension in _formats()
+        }
+    return variants
+
+
+def generate_variants(recipe_id, name):
+    """Строит варианты и записывает их в рецепт, если картинка та же."""
+    variants = build_variants(name)
+    if Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image_variants=variants
+    ):
+        recipe_changed.send(sender=Recipe, recipe_id=recipe_id)
+
+
+def _worker(recipe_id, name):
+    try:
+        generate_variants(recipe_id, name)
+    except Exception:
+        logger.exception('Image variants for recipe %s failed', recipe_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_variants(recipe):
+    """Ставит построение вариантов в фоновый поток после коммита."""
+    if not recipe.image:
+        return
+    recipe_id, name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: _get_executor().submit(_worker, recipe_id, name)
+    )
+
+
+def variant_urls(variants, request=None):
+    """URL вариантов картинки (значения Recipe.image_variants) для API."""
+    urls = {}
+    for label, files in (variants or {}).items():
+        urls[label] = {
+            extension: (
+                request.build_absolute_uri(default_storage.url(name))
+                if request is not None else default_storage.url(name)
+            )
+            for extension, name in files.items()
+        }
+    return urls
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from recipes.images import generate_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии картинок рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перестроить варианты и для рецептов, где они уже есть.',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        done = 0
+        for recipe_id, name in recipes.values_list('id', 'image').iterator():
+            try:
+                generate_variants(recipe_id, name)
+            except OSError as error:
+                self.stderr.write(f'Recipe {recipe_id}: {error}')
+                continue
+            done += 1
+        self.stdout.write(self.style.SUCCESS(f'Image variants built: {done}'))
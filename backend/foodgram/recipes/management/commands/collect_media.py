@@ -0,0 +1,69 @@
+import os
+import time
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы MEDIA_ROOT, на которые не ссылаются рецепты.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет удалено.',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help=(
+                'Не трогать файлы моложе указанного числа секунд: '
+                'их рецепт может быть ещё не сохранён.'
+            ),
+        )
+
+    def references(self):
+        """Число ссылок рецептов на каждый файл."""
+        counter = Counter()
+        recipes = Recipe.objects.values_list('image', 'image_variants')
+        for image, variants in recipes.iterator():
+            if image:
+                counter[image] += 1
+            for files in (variants or {}).values():
+                counter.update(files.values())
+        return counter
+
+    def walk(self, path=''):
+        directories, files = default_storage.listdir(path)
+        for name in files:
+            yield os.path.join(path, name)
+        for directory in directories:
+            yield from self.walk(os.path.join(path, directory))
+
+    def handle(self, *args, **options):
+        references = self.references()
+        threshold = time.time() - options['min_age']
+        removed = kept = freed = 0
+        for name in self.walk():
+            if references[name]:
+                kept += 1
+                continue
+            path = default_storage.path(name)
+            if os.path.getmtime(path) > threshold:
+                kept += 1
+                continue
+            freed += os.path.getsize(path)
+            removed += 1
+            if options['dry_run']:
+                self.stdout.write(f'- {name}')
+            else:
+                default_storage.delete(name)
+        self.stdout.write(
+            f'Referenced files: {len(references)}, kept: {kept}, '
+            f'removed: {removed} ({freed} bytes)'
+            + (' (dry run)' if options['dry_run'] else '')
+        )
@@ -1,30 +1,148 @@
 import csv
+import json
+import os
+import re
+import time
 
-from django.core.management.base import BaseCommand
-from recipes.models import Ingredient
+from api.cache import INGREDIENTS_CACHE_KEY, invalidate
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.models import Ingredient, normalize_search_key
+
+READ_CHUNK_SIZE = 64 * 1024
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+def read_csv(file):
+    for row in csv.reader(file, delimiter=','):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    """Читает JSON-массив объектов по частям, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('JSON file must contain an array')
+    position = 1
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Unexpected end of JSON file')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
 
 
 class Command(BaseCommand):
-    DATA = {
-        Ingredient: "ingredients.csv",
-    }
+    """Загрузка каталога ингредиентов.
+
+    Строка определяется парой (название, единица измерения). Дубли
+    в файле и уже загруженные строки пропускаются, у существующих
+    обновляется только ключ поиска. Повторный запуск безопасен.
+    """
+
+    help = 'Загружает каталог ингредиентов из CSV или JSON.'
+    FILENAME = 'ingredients'
+    BATCH_SIZE = 1000
 
     def add_arguments(self, parser):
         parser.add_argument("--data_directory", type=str)
+        parser.add_argument(
+            '--format', choices=tuple(READERS), default='csv',
+            help='Формат файла с данными.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Посчитать изменения, ничего не записывая.',
+        )
+        parser.add_argument(
+            '--diff', action='store_true',
+            help='Вывести добавляемые и обновляемые строки.',
+        )
 
     def handle(self, *args, **options):
         dirname = options["data_directory"] or './data/'
-        for model, filename in self.DATA.items():
-            with open(
-                f"{dirname}/{filename}",
-                newline="",
-                encoding="utf-8"
-            ) as csvfile:
-                reader = csv.reader(csvfile, delimiter=",")
-                for row in reader:
-                    model.objects.update_or_create(
-                        name=row[0],
-                        measurement_unit=row[1]
-                    )
-            print(f"{filename} successfully added to DB")
-        print("DB successfully filled")
+        file_format = options['format']
+        filename = f'{self.FILENAME}.{file_format}'
+        started = time.monotonic()
+        with open(
+            os.path.join(dirname, filename),
+            newline='',
+            encoding='utf-8'
+        ) as file:
+            stats = self.load(
+                READERS[file_format](file), options['dry_run'],
+                options['diff']
+            )
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'{filename}: inserted {stats["inserted"]}, '
+            f'updated {stats["updated"]}, skipped {stats["skipped"]} '
+            f'in {elapsed:.2f}s'
+            + (' (dry run)' if options['dry_run'] else '')
+        )
+        if not options['dry_run']:
+            invalidate(INGREDIENTS_CACHE_KEY)
+            self.stdout.write(self.style.SUCCESS('DB successfully filled'))
+
+    def load(self, rows, dry_run, diff):
+        existing = {
+            (name, unit): (pk, search_name)
+            for pk, name, unit, search_name in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit', 'search_name'
+            ).iterator()
+        }
+        seen = set()
+        to_create = []
+        to_update = []
+        skipped = 0
+        for name, unit in rows:
+            key = (name.strip(), unit.strip())
+            if not all(key) or key in seen:
+                skipped += 1
+                continue
+            seen.add(key)
+            search_name = normalize_search_key(key[0])
+            if key not in existing:
+                to_create.append(Ingredient(
+                    name=key[0], measurement_unit=key[1],
+                    search_name=search_name,
+                ))
+                if diff:
+                    self.stdout.write(f'+ {key[0]} ({key[1]})')
+            elif existing[key][1] != search_name:
+                to_update.append(Ingredient(
+                    id=existing[key][0], search_name=search_name,
+                ))
+                if diff:
+                    self.stdout.write(f'~ {key[0]} ({key[1]})')
+            else:
+                skipped += 1
+        if not dry_run:
+            with transaction.atomic():
+                Ingredient.objects.bulk_create(
+                    to_create, batch_size=self.BATCH_SIZE
+                )
+                Ingredient.objects.bulk_update(
+                    to_update, ['search_name'], batch_size=self.BATCH_SIZE
+                )
+        return {
+            'inserted': len(to_create),
+            'updated': len(to_update),
+            'skipped': skipped,
+        }
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import ShoppingListItem
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет сохранённые списки покупок с корзинами и пересобирает их.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только показать расхождения, ничего не меняя.',
+        )
+
+    def handle(self, *args, **options):
+        expected = {
+            (row['user_id'], row['ingredient_id']): row['total_amount']
+            for row in ShoppingListItem.objects.calculate().iterator()
+        }
+        stored = {
+            (row['user_id'], row['ingredient_id']): row['amount']
+            for row in ShoppingListItem.objects.values(
+                'user_id', 'ingredient_id', 'amount'
+            ).iterator()
+        }
+        drift = {
+            key for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        }
+        users = sorted({user_id for user_id, _ in drift})
+        self.stdout.write(
+            f'Rows out of sync: {len(drift)}, users affected: {len(users)}'
+        )
+        if options['verify']:
+            for user_id, ingredient_id in sorted(drift):
+                self.stdout.write(
+                    f'user={user_id} ingredient={ingredient_id} '
+                    f'stored={stored.get((user_id, ingredient_id))} '
+                    f'expected={expected.get((user_id, ingredient_id))}'
+                )
+            return
+        with transaction.atomic():
+            ShoppingListItem.objects.all().delete()
+            ShoppingListItem.objects.bulk_create(
+                (
+                    ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount,
+                    )
+                    for (user_id, ingredient_id), amount in expected.items()
+                ),
+                batch_size=BATCH_SIZE,
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f'Shopping lists rebuilt: {len(expected)} rows')
+        )
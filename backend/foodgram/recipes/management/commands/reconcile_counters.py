@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from foodgram.db import count_subquery
+from recipes.models import FavorRecipe, Recipe, ShoppingCart
+from users.models import User, UserSubscription
+
+# (модель, поле счётчика, модель строк, поле ссылки на модель,
+#  условия на строки). Связи с SET_NULL остаются после удаления
+# пользователя с user=NULL, такие строки не считаются.
+COUNTERS = (
+    (Recipe, 'favorites_count', FavorRecipe, 'recipe',
+     {'user__isnull': False}),
+    (Recipe, 'in_cart_count', ShoppingCart, 'recipe',
+     {'user__isnull': False}),
+    (User, 'recipes_count', Recipe, 'author', {}),
+    (User, 'followers_count', UserSubscription, 'subscribe_to',
+     {'user__isnull': False}),
+)
+
+
+class Command(BaseCommand):
+    help = 'Сверяет денормализованные счётчики с таблицами и чинит их.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только показать расхождения, ничего не меняя.',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for model, field, source, link, filters in COUNTERS:
+            expected = count_subquery(source, link, **filters)
+            drift = list(
+                model.objects.annotate(expected=expected).exclude(
+                    **{field: F('expected')}
+                ).values_list('pk', field, 'expected')
+            )
+            total += len(drift)
+            label = f'{model._meta.model_name}.{field}'
+            self.stdout.write(f'{label}: {len(drift)} rows out of sync')
+            if options['verify']:
+                for pk, stored, actual in drift:
+                    self.stdout.write(
+                        f'  id={pk} stored={stored} expected={actual}'
+                    )
+                continue
+            if drift:
+                with transaction.atomic():
+                    model.objects.filter(
+                        pk__in=[pk for pk, _, _ in drift]
+                    ).update(**{field: expected})
+        if not options['verify']:
+            self.stdout.write(
+                self.style.SUCCESS(f'Counters reconciled: {total} rows')
+            )
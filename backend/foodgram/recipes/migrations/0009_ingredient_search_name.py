@@ -0,0 +1,32 @@
+# Generated by Django 3.2 on 2026-10-17 04:20
+
+from django.db import migrations, models
+
+
+def fill_search_name(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    ingredients = list(Ingredient.objects.all())
+    for ingredient in ingredients:
+        ingredient.search_name = ' '.join(
+            ingredient.name.casefold().replace('ё', 'е').split()
+        )
+    Ingredient.objects.bulk_update(
+        ingredients, ['search_name'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_auto_20261017_0410'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='search_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=200, verbose_name='Ключ поиска'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_search_name, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2 on 2026-10-17 04:20
+
+from django.db import migrations, models
+
+
+def delete_duplicates(apps, schema_editor):
+    for model_name in ('FavorRecipe', 'ShoppingCart'):
+        model = apps.get_model('recipes', model_name)
+        keep = model.objects.values('user', 'recipe').annotate(
+            keep_id=models.Min('id')
+        ).values('keep_id')
+        model.objects.exclude(id__in=keep).filter(
+            user__isnull=False, recipe__isnull=False
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favorrecipe',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+    ]
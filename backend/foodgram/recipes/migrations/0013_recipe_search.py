@@ -0,0 +1,21 @@
+from django.db import migrations
+from recipes import search
+
+
+def install(apps, schema_editor):
+    search.install(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_auto_20261017_0421'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -1,6 +1,10 @@
+from django.core.exceptions import EmptyResultSet
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
-from django.db.models import Exists, OuterRef
+from django.db import models, transaction
+from django.db.models import F, Prefetch, Sum, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from foodgram.db import UniqueRelationQuerySet
 from users.models import User
 
 
@@ -35,6 +39,37 @@ class Tag(models.Model):
         verbose_name_plural = 'Теги'
 
 
+def normalize_search_key(value):
+    """Ключ поиска: без учёта регистра, ё == е, лишние пробелы убраны."""
+    return ' '.join(value.casefold().replace('ё', 'е').split())
+
+
+class IngredientQuerySet(models.QuerySet):
+    def search(self, keyword, limit=None):
+        """Ингредиенты, в названии которых есть keyword.
+
+        Сначала идут совпадения с начала названия (по индексу на
+        search_name), затем — совпадения внутри названия. Пустой после
+        normalize_search_key keyword ничего не отбирает, поэтому
+        IngredientViewSet обрабатывает его как отсутствие поиска.
+        """
+        key = normalize_search_key(keyword)
+        prefix = self.filter(search_name__startswith=key).order_by('name')
+        if limit is not None:
+            prefix = prefix[:limit]
+        result = list(prefix)
+        if limit is not None and len(result) >= limit:
+            return result
+        substring = self.filter(
+            search_name__contains=key
+        ).exclude(
+            search_name__startswith=key
+        ).order_by('name')
+        if limit is not None:
+            substring = substring[:limit - len(result)]
+        return result + list(substring)
+
+
 class Ingredient(models.Model):
     name = models.CharField(
         verbose_name='Название',
@@ -46,29 +81,61 @@ class Ingredient(models.Model):
         max_length=200,
         blank=False,
     )
+    search_name = models.CharField(
+        verbose_name='Ключ поиска',
+        max_length=200,
+        editable=False,
+        db_index=True,
+    )
+    objects = IngredientQuerySet.as_manager()
 
     def __str__(self):
         return self.name[:20]
 
+    def save(self, *args, **kwargs):
+        self.search_name = normalize_search_key(self.name)
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
 
 
 class RecipeQuerySet(models.QuerySet):
-    def add_user_annotation(self, user_id):
-        return self.annotate(
-            is_favorited=Exists(
-                FavorRecipe.objects.filter(
-                    recipe__pk=OuterRef('pk'),
-                    user_id=user_id,
-                )
-            ),
-            is_in_shopping_cart=Exists(
-                ShoppingCart.objects.filter(
-                    recipe__pk=OuterRef('pk'),
-                    user_id=user_id
-                )
+    def first_by_author(self, authors, limit):
+        """Не больше limit первых рецептов каждого из authors.
+
+        Рецепты авторов нумеруются оконной функцией за один проход;
+        фильтр по номеру вынесен во внешний запрос, потому что Django
+        не фильтрует по оконным выражениям.
+        """
+        ranked = Recipe.objects.filter(author__in=authors).annotate(
+            row_number=Window(
+                RowNumber(), partition_by=[F('author')],
+                order_by=F('id').asc(),
+            )
+        ).values('id', 'row_number')
+        try:
+            sql, params = ranked.query.sql_with_params()
+        except EmptyResultSet:
+            return self.none()
+        return self.filter(
+            id__in=RawSQL(
+                f'SELECT ranked.id FROM ({sql}) ranked '
+                'WHERE ranked.row_number <= %s',
+                (*params, limit),
+            )
+        )
+
+    def prefetch_for_read(self):
+        """Всё, что нужно RecipeSerializer, за постоянное число запросов."""
+        return self.select_related('author').prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.order_by('id')),
+            Prefetch(
+                'ingredientsamount_set',
+                queryset=IngredientsAmount.objects.select_related(
+                    'ingredient'
+                ).order_by('id')
             ),
         )
 
@@ -113,10 +180,28 @@ class Recipe(models.Model):
         verbose_name='Название',
         max_length=200,
         blank=False,
+        db_index=True,
     )
     image = models.ImageField(blank=True, verbose_name='Картинка')
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии картинки',
+    )
     text = models.TextField(verbose_name='Текст рецепта')
     cooking_time = models.IntegerField(verbose_name='Время приготовления',)
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        db_index=True,
+        verbose_name='Число добавлений в избранное',
+    )
+    in_cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число добавлений в корзину',
+    )
     objects = RecipeQuerySet.as_manager()
 
     def __str__(self):
@@ -162,9 +247,17 @@ class ShoppingCart(models.Model):
         verbose_name='Рецепт',
     )
 
+    objects = UniqueRelationQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'В корзине у'
         verbose_name_plural = 'В корзине у'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_shopping_cart',
+            ),
+        ]
 
 
 class FavorRecipe(models.Model):
@@ -179,6 +272,95 @@ class FavorRecipe(models.Model):
         verbose_name='Рецепт',
     )
 
+    objects = UniqueRelationQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'В избранном у'
         verbose_name_plural = 'В избранном у'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_favorite',
+            ),
+        ]
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    def calculate(self, user_ids=None, ingredient_ids=None):
+        """Суммы ингредиентов в корзинах, посчитанные по рецептам."""
+        # Условия на корзину — в одном filter(): иначе каждый вызов
+        # добавляет свой JOIN и суммы умножаются на число корзин.
+        cart_filter = {'recipe__shoppingcart__user__isnull': False}
+        if user_ids is not None:
+            cart_filter['recipe__shoppingcart__user__in'] = user_ids
+        queryset = IngredientsAmount.objects.filter(**cart_filter)
+        if ingredient_ids is not None:
+            queryset = queryset.filter(ingredient__in=ingredient_ids)
+        return queryset.values(
+            'ingredient_id',
+            user_id=models.F('recipe__shoppingcart__user'),
+        ).annotate(
+            total_amount=Sum('amount')
+        ).order_by()
+
+    def refresh(self, user_ids, ingredient_ids=None):
+        """Пересчитывает строки списка покупок пользователей user_ids.
+
+        Если передан ingredient_ids, пересчитываются только эти
+        ингредиенты — этого достаточно после изменения одного рецепта.
+        """
+        user_ids = sorted(set(user_ids))
+        stale = self.filter(user__in=user_ids)
+        if ingredient_ids is not None:
+            ingredient_ids = list(ingredient_ids)
+            stale = stale.filter(ingredient__in=ingredient_ids)
+        with transaction.atomic():
+            # Блокировка строк пользователей упорядочивает параллельные
+            # пересчёты: иначе оба вставят одну строку после удаления.
+            list(
+                User.objects.select_for_update().filter(
+                    pk__in=user_ids
+                ).order_by('pk').values_list('pk', flat=True)
+            )
+            stale.delete()
+            self.bulk_create(
+                self.model(
+                    user_id=row['user_id'],
+                    ingredient_id=row['ingredient_id'],
+                    amount=row['total_amount'],
+                )
+                for row in self.calculate(user_ids, ingredient_ids)
+            )
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя.
+
+    Поддерживается при добавлении/удалении рецепта из корзины и при
+    изменении ингредиентов рецепта, чтобы скачивание списка покупок
+    было одним чтением по индексу. Сверить и пересобрать таблицу можно
+    командой ``rebuild_shopping_lists``.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    amount = models.IntegerField(verbose_name='Количество')
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item',
+            ),
+        ]
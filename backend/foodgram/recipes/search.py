@@ -0,0 +1,168 @@
+"""Полнотекстовый поиск рецептов по названию и описанию.
+
+PostgreSQL: GIN-индекс по выражению to_tsvector('russian', ...), запрос
+повторяет выражение индекса, поэтому индекс используется и вместе с
+другими условиями WHERE. Индекс по выражению обновляется самой СУБД
+при записи рецепта.
+
+SQLite: таблица FTS5 с внешним содержимым и триггеры, которые держат её
+в синхронизации с recipes_recipe. Триггеры пропадают, когда миграция
+пересоздаёт таблицу, поэтому install() повторяется после каждого migrate.
+"""
+from django.db import connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe
+
+TABLE = Recipe._meta.db_table
+PG_INDEX = 'recipes_recipe_search_idx'
+PG_DOCUMENT = (
+    "setweight(to_tsvector('russian', coalesce({table}name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce({table}text, '')), 'B')"
+)
+FTS_TABLE = 'recipes_recipe_fts'
+# Вес совпадения в названии относительно описания в bm25.
+FTS_WEIGHTS = '10.0, 1.0'
+
+
+def _pg_document(qualified=True):
+    return PG_DOCUMENT.format(table=f'"{TABLE}".' if qualified else '')
+
+
+def _install_postgresql(cursor):
+    cursor.execute(
+        f'CREATE INDEX IF NOT EXISTS {PG_INDEX} ON {TABLE} '
+        f'USING gin (({_pg_document(qualified=False)}))'
+    )
+
+
+def _install_sqlite(cursor):
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+        [FTS_TABLE],
+    )
+    created = cursor.fetchone() is None
+    cursor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+        f"name, text, content='{TABLE}', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+    insert = (
+        f'INSERT INTO {FTS_TABLE}(rowid, name, text) '
+        'VALUES (new.id, new.name, new.text);'
+    )
+    delete = (
+        f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text) '
+        "VALUES ('delete', old.id, old.name, old.text);"
+    )
+    triggers = {
+        'ai': ('AFTER INSERT', insert),
+        'ad': ('AFTER DELETE', delete),
+        'au': ('AFTER UPDATE OF name, text', delete + insert),
+    }
+    for suffix, (event, body) in triggers.items():
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_{suffix} '
+            f'{event} ON {TABLE} BEGIN {body} END'
+        )
+    if created:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
+
+
+def _uninstall_postgresql(cursor):
+    cursor.execute(f'DROP INDEX IF EXISTS {PG_INDEX}')
+
+
+def _uninstall_sqlite(cursor):
+    for suffix in ('ai', 'ad', 'au'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+    cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+INSTALLERS = {
+    'postgresql': (_install_postgresql, _uninstall_postgresql),
+    'sqlite': (_install_sqlite, _uninstall_sqlite),
+}
+
+
+def install(connection):
+    """Создаёт индекс поиска для СУБД соединения, если его ещё нет."""
+    if connection.vendor in INSTALLERS:
+        with connection.cursor() as cursor:
+            INSTALLERS[connection.vendor][0](cursor)
+
+
+def uninstall(connection):
+    if connection.vendor in INSTALLERS:
+        with connection.cursor() as cursor:
+            INSTALLERS[connection.vendor][1](cursor)
+
+
+def _search_postgresql(queryset, query):
+    document = _pg_document()
+    tsquery = "websearch_to_tsquery('russian', %s)"
+    return queryset.filter(
+        RawSQL(
+            f'({document}) @@ {tsquery}', [query],
+            output_field=BooleanField(),
+        )
+    ).annotate(
+        search_rank=RawSQL(
+            f'ts_rank({document}, {tsquery})', [query],
+            output_field=FloatField(),
+        )
+    ).order_by('-search_rank', 'id')
+
+
+def _fts_match(query):
+    """Запрос FTS5: каждое слово в кавычках и как префикс, через AND."""
+    words = query.replace('"', ' ').split()
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _search_sqlite(queryset, query):
+    match = _fts_match(query)
+    if not match:
+        return queryset.none()
+    return queryset.filter(
+        id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [match],
+        )
+    ).annotate(
+        # bm25 тем меньше, чем лучше совпадение.
+        search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {FTS_WEIGHTS}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{TABLE}"."id"',
+            [match],
+            output_field=FloatField(),
+        )
+    ).order_by('-search_rank', 'id')
+
+
+def _search_fallback(queryset, query):
+    return queryset.filter(name__icontains=query)
+
+
+SEARCHERS = {
+    'postgresql': _search_postgresql,
+    'sqlite': _search_sqlite,
+}
+
+
+def search_recipes(queryset, query):
+    """Рецепты, подходящие под запрос, от самых релевантных."""
+    vendor = connections[queryset.db].vendor
+    return SEARCHERS.get(vendor, _search_fallback)(queryset, query)
+
+
+def restore(connection):
+    """Возвращает триггеры SQLite, если поиск уже установлен миграцией."""
+    if (
+        connection.vendor == 'sqlite'
+        and FTS_TABLE in connection.introspection.table_names()
+    ):
+        install(connection)
@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Рецепт изменён в обход save(), например через queryset.update().
+recipe_changed = Signal()
@@ -0,0 +1,77 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, где имя файла — sha256 его содержимого.
+
+    Одинаковые картинки (например, при каждом PATCH рецепта) пишутся на
+    диск один раз: если файл с таким содержимым уже есть, возвращается
+    его имя. Каталог из исходного имени сохраняется, расширение тоже.
+    Файлы, на которые больше не ссылается ни один рецепт, удаляет
+    команда ``collect_media``.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        path = self.path(name)
+        try:
+            # Свежий mtime не даёт collect_media удалить файл, на
+            # который вот-вот сошлётся сохраняемый рецепт.
+            os.utime(path)
+        except FileNotFoundError:
+            self._write(path, content)
+        return name
+
+    def _write(self, path, content):
+        """Пишет во временный файл и переименовывает его на место.
+
+        Параллельная загрузка того же содержимого просто заменит файл
+        таким же, имя по хешу не получит случайного суффикса.
+        """
+        directory = os.path.dirname(path)
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+            try:
+                os.makedirs(
+                    directory, self.directory_permissions_mode,
+                    exist_ok=True,
+                )
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporary, self.file_permissions_mode)
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+    @staticmethod
+    def content_name(name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        digest = digest.hexdigest()
+        dirname = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(dirname, digest[:2], f'{digest}{extension}')
@@ -4,7 +4,11 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.forms import ReadOnlyPasswordHashField
 from django.contrib.auth.models import Group
 from django.core.exceptions import ValidationError
+from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
+from foodgram.admin_utils import (EstimatedCountPaginator,
+                                  PaginatedTabularInline)
+from foodgram.db import count_subquery
 from users.models import User, UserSubscription
 
 
@@ -53,9 +57,11 @@ class UserChangeForm(forms.ModelForm):
             )
 
 
-class SubscriptionInline(admin.TabularInline):
+class SubscriptionInline(PaginatedTabularInline):
     model = UserSubscription
     fk_name = 'user'
+    extra = 0
+    autocomplete_fields = ('subscribe_to',)
     verbose_name = "Подписки пользователя"
 
 
@@ -72,12 +78,13 @@ class UserAdmin(BaseUserAdmin):
     )
     list_display_links = ('username',)
     list_editable = ('role',)
-    search_fields = ('username', 'role')
+    search_fields = ('username', 'email')
     empty_value_display = "-пусто-"
     list_filter = (
-        'username',
-        'email',
+        'role',
     )
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         (None, {'fields': (
             'username',
@@ -90,6 +97,36 @@ class UserAdmin(BaseUserAdmin):
         )}),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по началу юзернейма или email через их индексы."""
+        if not search_term:
+            return queryset, False
+        return queryset.filter(
+            Q(username__startswith=search_term)
+            | Q(email__startswith=search_term)
+        ), False
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        targets = set()
+        for formset in formsets:
+            if formset.model is not UserSubscription:
+                continue
+            for inline_form in formset.forms:
+                if inline_form.has_changed():
+                    targets.add(inline_form.initial.get('subscribe_to'))
+                    targets.add(getattr(
+                        inline_form.cleaned_data.get('subscribe_to'),
+                        'pk', None
+                    ))
+        targets.discard(None)
+        if targets:
+            User.objects.filter(pk__in=targets).update(
+                followers_count=count_subquery(
+                    UserSubscription, 'subscribe_to', user__isnull=False
+                )
+            )
+
 
 admin.site.register(User, UserAdmin)
 admin.site.unregister(Group)
@@ -0,0 +1,50 @@
+# Generated by Django 3.2 on 2026-10-17 04:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.expressions
+
+
+def delete_duplicates(apps, schema_editor):
+    UserSubscription = apps.get_model('users', 'UserSubscription')
+    UserSubscription.objects.filter(user=models.F('subscribe_to')).delete()
+    keep = UserSubscription.objects.values('user', 'subscribe_to').annotate(
+        keep_id=models.Min('id')
+    ).values('keep_id')
+    UserSubscription.objects.exclude(id__in=keep).filter(
+        user__isnull=False, subscribe_to__isnull=False
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_auto_20230202_1601'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='usersubscription',
+            options={'verbose_name': 'Подписка', 'verbose_name_plural': 'Подписки'},
+        ),
+        migrations.AlterField(
+            model_name='usersubscription',
+            name='subscribe_to',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='usersubscription_subscribe_to', to=settings.AUTH_USER_MODEL, verbose_name='Подписаться на'),
+        ),
+        migrations.AlterField(
+            model_name='usersubscription',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddConstraint(
+            model_name='usersubscription',
+            constraint=models.UniqueConstraint(fields=('user', 'subscribe_to'), name='unique_subscription'),
+        ),
+        migrations.AddConstraint(
+            model_name='usersubscription',
+            constraint=models.CheckConstraint(check=models.Q(_negated=True, user=django.db.models.expressions.F('subscribe_to')), name='no_self_subscription'),
+        ),
+    ]
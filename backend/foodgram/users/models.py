@@ -1,7 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 from django.db import models
-from django.db.models import Exists, OuterRef
+from foodgram.db import UniqueRelationQuerySet
 
 from .managers import CustomUserManager
 
@@ -17,15 +17,7 @@ CHOICES = (
 
 
 class UserQuerySet(models.QuerySet):
-    def add_user_annotation(self, user_id):
-        return self.annotate(
-            is_subscribed=Exists(
-                UserSubscription.objects.filter(
-                    subscribe_to=OuterRef('pk'),
-                    user_id=user_id
-                )
-            )
-        )
+    pass
 
 
 class UserManager(CustomUserManager):
@@ -48,6 +40,7 @@ class User(AbstractUser):
         max_length=150,
         verbose_name='Юзернейм',
         blank=False,
+        db_index=True,
     )
     email = models.EmailField(
         verbose_name='Email',
@@ -72,6 +65,16 @@ class User(AbstractUser):
         default=GUEST,
         max_length=50,
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число подписчиков',
+    )
     objects = MyCustomManager()
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = [
@@ -114,6 +117,18 @@ class UserSubscription(models.Model):
         related_name='usersubscription_subscribe_to',
     )
 
+    objects = UniqueRelationQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'subscribe_to'),
+                name='unique_subscription',
+            ),
+            models.CheckConstraint(
+                check=~models.Q(user=models.F('subscribe_to')),
+                name='no_self_subscription',
+            ),
+        ]
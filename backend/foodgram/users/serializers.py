@@ -25,15 +25,18 @@ class TokenCreateSerializer(serializers.Serializer):
         self.fields[self.email_field] = serializers.EmailField()
 
     def validate(self, attrs):
-        password = attrs.get("password")
+        """Один расчёт хеша пароля на попытку входа.
+
+        Хеш считает authenticate(), в том числе впустую для неизвестного
+        email. Пароль без значения заменяется пустой строкой: иначе
+        бэкенд не хеширует, и время ответа выдаёт, есть ли такой
+        пользователь.
+        """
+        password = attrs.get("password") or ""
         email = attrs.get("email").lower()
         self.user = authenticate(
             request=self.context.get("request"), email=email, password=password
         )
         if not self.user:
-            self.user = User.objects.filter(email=email).first()
-            if self.user and not self.user.check_password(password):
-                self.fail("invalid_credentials")
-        if self.user and self.user.is_active:
-            return attrs
-        self.fail("invalid_credentials")
+            self.fail("invalid_credentials")
+        return attrs
@@ -0,0 +1,24 @@
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+from .models import User
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(instance, **kwargs):
+    token_cache.delete(instance.key)
+
+
+@receiver(user_logged_out)
+@receiver((post_save, post_delete), sender=User)
+def forget_user_tokens(user=None, instance=None, update_fields=None,
+                       **kwargs):
+    # Вход обновляет только last_login, на права пользователя он не влияет.
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    user = user or instance
+    if user is not None:
+        token_cache.delete_user(user.pk)
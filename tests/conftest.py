@@ -1,3 +1,4 @@
 pytest_plugins = [
+    'tests.fixtures.fixture_cache',
     'tests.fixtures.fixture_user',
 ]
@@ -0,0 +1,1232 @@
+import base64
+import datetime
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from api.fast_serializers import (RECIPE_COLUMNS, USER_COLUMNS,
+                                  FastRecipeSerializer, FastUserSerializer)
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer
+from api.serializers import RecipeSerializer, UserSerializer
+from api.views import RecipesViewSet
+from recipes.images import generate_variants
+from recipes.models import (FavorRecipe, Ingredient, IngredientsAmount,
+                            Recipe, ShoppingListItem, Tag)
+
+User = get_user_model()
+
+
+class RecipesTestMixin:
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='cook@test.test', username='Cook',
+            first_name='Cook', last_name='Cook', password='TestPassword',
+        )
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        cls.sugar = Ingredient.objects.create(
+            name='сахар', measurement_unit='г'
+        )
+        cls.milk = Ingredient.objects.create(
+            name='молоко', measurement_unit='мл'
+        )
+
+    @classmethod
+    def create_recipe(cls, name='Каша', author=None, amounts=None):
+        recipe = Recipe.objects.create(
+            author=author or cls.user, name=name, text='Текст',
+            cooking_time=10,
+        )
+        recipe.tags.add(cls.tag)
+        for ingredient, amount in (amounts or {cls.sugar: 10}).items():
+            IngredientsAmount.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=amount
+            )
+        return recipe
+
+
+class TestShoppingCart(RecipesTestMixin, APITestCase):
+
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.recipes = []
+        for name in ('Каша', 'Какао'):
+            recipe = self.create_recipe(
+                name, amounts={self.sugar: 10, self.milk: 200}
+            )
+            self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+            self.recipes.append(recipe)
+
+    def get_shopping_list(self):
+        return dict(
+            ShoppingListItem.objects.filter(
+                user=self.user
+            ).values_list('ingredient__name', 'amount')
+        )
+
+    def test_download_txt(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(
+            content, 'молоко (мл) - 400\nсахар (г) - 20\n'
+        )
+
+    def test_download_csv(self):
+        response = self.client.get(self.url, {'file_format': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[1:], ['молоко,мл,400', 'сахар,г,20'])
+
+    def test_download_pdf(self):
+        response = self.client.get(self.url, {'file_format': 'pdf'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(
+            b''.join(response.streaming_content).startswith(b'%PDF')
+        )
+
+    def test_download_unknown_format(self):
+        response = self.client.get(self.url, {'file_format': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(),
+            {'file_format': 'Available formats: txt, csv, pdf'},
+        )
+
+    def test_download_format_negotiated(self):
+        response = self.client.get(self.url, {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        response = self.client.get(self.url, HTTP_ACCEPT='application/pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+    def test_remove_from_cart_updates_list(self):
+        self.client.delete(f'/api/recipes/{self.recipes[0].id}/shopping_cart/')
+        self.assertEqual(
+            self.get_shopping_list(), {'сахар': 10, 'молоко': 200}
+        )
+
+    def test_recipe_update_updates_list(self):
+        recipe = self.recipes[0]
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            {
+                'name': recipe.name, 'text': recipe.text,
+                'cooking_time': recipe.cooking_time, 'tags': [self.tag.id],
+                'ingredients': [{'id': self.milk.id, 'amount': 50}],
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.get_shopping_list(), {'сахар': 10, 'молоко': 250}
+        )
+
+    def test_recipe_delete_updates_list(self):
+        self.client.delete(f'/api/recipes/{self.recipes[0].id}/')
+        self.assertEqual(
+            self.get_shopping_list(), {'сахар': 10, 'молоко': 200}
+        )
+
+    def test_rebuild_shopping_lists(self):
+        ShoppingListItem.objects.filter(ingredient=self.sugar).update(
+            amount=1
+        )
+        out = StringIO()
+        call_command('rebuild_shopping_lists', '--verify', stdout=out)
+        self.assertIn('Rows out of sync: 1', out.getvalue())
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.assertEqual(
+            self.get_shopping_list(), {'сахар': 20, 'молоко': 400}
+        )
+
+    def test_recipe_shared_by_carts(self):
+        other = User.objects.create_user(
+            email='other@test.test', username='Other',
+            first_name='Other', last_name='Other', password='TestPassword',
+        )
+        self.client.force_authenticate(other)
+        self.client.post(f'/api/recipes/{self.recipes[0].id}/shopping_cart/')
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(
+                user=other
+            ).values_list('ingredient__name', 'amount')),
+            {'сахар': 10, 'молоко': 200},
+        )
+        self.assertEqual(
+            self.get_shopping_list(), {'сахар': 20, 'молоко': 400}
+        )
+        out = StringIO()
+        call_command('rebuild_shopping_lists', '--verify', stdout=out)
+        self.assertIn('Rows out of sync: 0', out.getvalue())
+
+    def admin_change(self, recipe, update):
+        """Сохраняет рецепт в админке; update правит данные формы."""
+        admin_user = User.objects.create_superuser(
+            email='admin@test.test', password='TestPassword',
+            username='Admin', first_name='Admin', last_name='Admin',
+        )
+        self.client.force_login(admin_user)
+        url = f'/admin/recipes/recipe/{recipe.id}/change/'
+        response = self.client.get(url)
+        data = {}
+        forms = [response.context['adminform'].form]
+        for inline in response.context['inline_admin_formsets']:
+            formset = inline.formset
+            forms.append(formset.management_form)
+            forms.extend(formset.initial_forms)
+        for form in forms:
+            for name, field in form.fields.items():
+                if name in ('image', 'DELETE'):
+                    continue
+                value = form.initial.get(name, field.initial)
+                if isinstance(value, (list, tuple)):
+                    value = [getattr(item, 'pk', item) for item in value]
+                if value is not None:
+                    data[form.add_prefix(name)] = value
+        # Только существующие строки, без пустых форм extra.
+        for key in [key for key in data if key.endswith('-INITIAL_FORMS')]:
+            data[key.replace('INITIAL', 'TOTAL')] = data[key]
+        update(data)
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+
+    def test_admin_ingredient_change_updates_list(self):
+        def update(data):
+            data['ingredientsamount_set-0-amount'] = 30
+            data['ingredientsamount_set-1-DELETE'] = 'on'
+
+        self.admin_change(self.recipes[0], update)
+        self.assertEqual(
+            self.get_shopping_list(), {'сахар': 40, 'молоко': 200}
+        )
+
+    def test_admin_cart_change_updates_list(self):
+        def update(data):
+            data['shoppingcart_set-0-DELETE'] = 'on'
+
+        self.admin_change(self.recipes[0], update)
+        self.assertEqual(
+            self.get_shopping_list(), {'сахар': 10, 'молоко': 200}
+        )
+
+
+class TestRecipeQueries(RecipesTestMixin, APITestCase):
+    """Число запросов не должно зависеть от количества рецептов."""
+
+    url = '/api/recipes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for index in range(10):
+            author = User.objects.create_user(
+                email=f'author{index}@test.test', username=f'author{index}',
+                first_name='A', last_name='A', password='TestPassword',
+            )
+            cls.create_recipe(
+                f'Рецепт {index}', author=author,
+                amounts={cls.sugar: index + 1, cls.milk: 100},
+            )
+
+    def assert_list_queries(self, number):
+        for limit in (1, 10):
+            cache.clear()
+            with self.assertNumQueries(number):
+                response = self.client.get(self.url, {'limit': limit})
+            self.assertEqual(len(response.json()['results']), limit)
+
+    def test_list_anonymous(self):
+        self.assert_list_queries(4)
+
+    def test_list_authenticated(self):
+        # Плюс один запрос наборов избранного, корзины и подписок.
+        self.client.force_authenticate(self.user)
+        self.assert_list_queries(5)
+
+    def test_count_is_cheap_and_cached(self):
+        self.client.force_authenticate(self.user)
+        FavorRecipe.objects.create(
+            user=self.user, recipe=Recipe.objects.first()
+        )
+        params = {'is_favorited': 1}
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.json()['count'], 1)
+        self.assertTrue(response.json()['count_exact'])
+        count_sql = next(
+            query['sql'] for query in context
+            if query['sql'].startswith('SELECT COUNT')
+        )
+        self.assertNotIn('AS "is_favorited"', count_sql)
+        self.assertNotIn('ORDER BY', count_sql)
+        # Повторно не считаются ни count, ни наборы пользователя.
+        with self.assertNumQueries(len(context) - 2):
+            self.client.get(self.url, {**params, 'limit': 2})
+
+    @override_settings(PAGINATION_EXACT_COUNT_LIMIT=100)
+    def test_estimated_count(self):
+        with mock.patch('foodgram.db.estimate_count', return_value=50000):
+            response = self.client.get(self.url)
+        self.assertEqual(response.json()['count'], 50000)
+        self.assertFalse(response.json()['count_exact'])
+
+    @override_settings(PAGINATION_EXACT_COUNT_LIMIT=1)
+    def test_pages_beyond_underestimate(self):
+        with mock.patch('foodgram.db.estimate_count', return_value=2):
+            response = self.client.get(self.url, {'limit': 1, 'page': 5})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()['count'], 2)
+            self.assertIsNotNone(response.json()['next'])
+            response = self.client.get(self.url, {'limit': 1, 'page': 10})
+            self.assertEqual(len(response.json()['results']), 1)
+            self.assertIsNone(response.json()['next'])
+            response = self.client.get(self.url, {'limit': 1, 'page': 11})
+            self.assertEqual(
+                response.status_code, status.HTTP_404_NOT_FOUND
+            )
+
+    def test_cursor_pages(self):
+        params = {'pagination': 'cursor', 'limit': 3, 'tags': 'breakfast'}
+        response = self.client.get(self.url, params)
+        self.assertNotIn('count', response.json())
+        ids = [recipe['id'] for recipe in response.json()['results']]
+        while response.json()['next']:
+            # Без COUNT: каждая страница стоит одинаково.
+            with self.assertNumQueries(3):
+                response = self.client.get(response.json()['next'])
+            ids += [recipe['id'] for recipe in response.json()['results']]
+        self.assertEqual(
+            ids, list(Recipe.objects.order_by('id').values_list('id', flat=True))
+        )
+
+    def test_cursor_pages_with_ordering(self):
+        for index, recipe in enumerate(Recipe.objects.order_by('id')):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                favorites_count=(index * 7) % 10, in_cart_count=10 - index
+            )
+        for field in RecipesViewSet.ordering_fields:
+            for ordering in (field, f'-{field}'):
+                params = {
+                    'pagination': 'cursor', 'limit': 3, 'ordering': ordering,
+                }
+                response = self.client.get(self.url, params)
+                ids = []
+                while True:
+                    self.assertEqual(
+                        response.status_code, status.HTTP_200_OK
+                    )
+                    results = response.json()['results']
+                    self.assertNotIn('favorites_count', results[0])
+                    self.assertNotIn('in_cart_count', results[0])
+                    ids += [recipe['id'] for recipe in results]
+                    if not response.json()['next']:
+                        break
+                    response = self.client.get(response.json()['next'])
+                self.assertEqual(ids, list(
+                    Recipe.objects.order_by(ordering).values_list(
+                        'id', flat=True
+                    )
+                ), ordering)
+
+    def test_retrieve(self):
+        recipe = Recipe.objects.first()
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(4):
+            response = self.client.get(f'{self.url}{recipe.id}/')
+        self.assertEqual(len(response.json()['ingredients']), 2)
+        self.assertEqual(len(response.json()['tags']), 1)
+
+    def test_fast_serializers_match_model_serializers(self):
+        recipes = list(Recipe.objects.order_by('id'))
+        recipes[0].image = 'recipes/image.jpg'
+        recipes[0].image_variants = {'card': {'jpg': 'variants/card.jpg'}}
+        recipes[0].save()
+        recipes[1].tags.add(
+            Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        )
+        FavorRecipe.objects.create(user=self.user, recipe=recipes[1])
+        self.user.subscription.add(recipes[2].author)
+        request = Request(APIRequestFactory().get(self.url))
+        request.user = self.user
+        context = {'request': request}
+        render = JSONRenderer().render
+        self.assertEqual(
+            render(FastRecipeSerializer(
+                Recipe.objects.order_by('id').values(*RECIPE_COLUMNS),
+                many=True, context=context,
+            ).data),
+            render(RecipeSerializer(
+                Recipe.objects.prefetch_for_read().order_by('id'),
+                many=True, context=context,
+            ).data),
+        )
+        self.assertEqual(
+            render(FastUserSerializer(
+                User.objects.values(*USER_COLUMNS), many=True,
+                context=context,
+            ).data),
+            render(UserSerializer(
+                User.objects.all(), many=True, context=context,
+            ).data),
+        )
+
+
+class TestRecipeWrite(RecipesTestMixin, APITestCase):
+
+    url = '/api/recipes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(30)
+        ]
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def payload(self, amounts):
+        return {
+            'name': 'Каша', 'text': 'Текст', 'cooking_time': 10,
+            'tags': [self.tag.id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in amounts.items()
+            ],
+        }
+
+    def assert_matches_read(self, response):
+        self.assertEqual(
+            response.content,
+            self.client.get(f'{self.url}{response.json()["id"]}/').content,
+        )
+
+    def test_create(self):
+        response = self.client.post(
+            self.url, self.payload({self.milk: 100, self.sugar: 5}),
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assert_matches_read(response)
+
+    def test_unknown_ids(self):
+        payload = self.payload({self.milk: 100})
+        payload['tags'] = [self.tag.id, 998]
+        payload['ingredients'].append({'id': 999, 'amount': 1})
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(
+            response.status_code, status.HTTP_400_BAD_REQUEST
+        )
+        self.assertEqual(response.json(), {
+            'tags': ['Unknown ids: 998.'],
+            'ingredients': ['Unknown ingredient ids: 999.'],
+        })
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_duplicates_are_merged(self):
+        payload = self.payload({self.milk: 100, self.sugar: 5})
+        payload['ingredients'].append({'id': self.milk.id, 'amount': 50})
+        payload['tags'].append(self.tag.id)
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            {
+                ingredient['id']: ingredient['amount']
+                for ingredient in response.json()['ingredients']
+            },
+            {self.milk.id: 150, self.sugar.id: 5},
+        )
+        self.assertEqual(len(response.json()['tags']), 1)
+
+    def test_create_queries_do_not_depend_on_size(self):
+        tags = [self.tag] + [
+            Tag.objects.create(
+                name=f'Тег {index}', color='#000000', slug=f'tag-{index}'
+            )
+            for index in range(5)
+        ]
+        counts = []
+        for ingredients, tags_count in ((self.ingredients[:1], 1),
+                                        (self.ingredients, len(tags))):
+            payload = self.payload(dict.fromkeys(ingredients, 10))
+            payload['tags'] = [tag.id for tag in tags[:tags_count]]
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(self.url, payload, format='json')
+            self.assertEqual(
+                response.status_code, status.HTTP_201_CREATED
+            )
+            counts.append(len(context))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_patch_touches_only_changed_rows(self):
+        recipe = self.create_recipe(
+            amounts={ingredient: 10 for ingredient in self.ingredients}
+        )
+        amounts = {ingredient: 10 for ingredient in self.ingredients[1:]}
+        amounts[self.ingredients[1]] = 20
+        amounts[self.milk] = 100
+        before = set(
+            recipe.ingredientsamount_set.values_list('id', flat=True)
+        )
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'{self.url}{recipe.id}/', self.payload(amounts),
+                format='json',
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        writes = [
+            query['sql'] for query in context
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+        # Удаление, добавление и изменение по одной строке ингредиентов.
+        self.assertEqual(len(writes), 3)
+        after = set(
+            recipe.ingredientsamount_set.values_list('id', flat=True)
+        )
+        self.assertEqual(len(before - after), 1)
+        self.assertEqual(len(after - before), 1)
+        self.assertEqual(
+            dict(recipe.ingredientsamount_set.values_list(
+                'ingredient', 'amount'
+            )),
+            {ingredient.id: amount for ingredient, amount in amounts.items()},
+        )
+        self.assert_matches_read(response)
+
+    def test_patch_without_changes_writes_nothing(self):
+        recipe = self.create_recipe(amounts={self.milk: 100})
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'{self.url}{recipe.id}/', self.payload({self.milk: 100}),
+                format='json',
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([
+            query['sql'] for query in context
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ])
+
+
+class TestIngredientSearch(APITestCase):
+
+    url = '/api/ingredients/'
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('Ёжевика', 'ежевичный сок', 'морс из ежевики', 'мёд'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_prefix_before_substring(self):
+        self.assertEqual(
+            self.search(name='ЕЖЕВ'),
+            ['Ёжевика', 'ежевичный сок', 'морс из ежевики']
+        )
+
+    def test_limit(self):
+        self.assertEqual(
+            self.search(name='ёжев', limit=1), ['Ёжевика']
+        )
+        self.assertEqual(
+            self.search(name='ежев', limit=3)[-1], 'морс из ежевики'
+        )
+
+    def test_blank_name_lists_all(self):
+        everything = self.search()
+        with mock.patch.object(Ingredient.objects, 'search') as search:
+            for name in ('   ', '\u3000\t'):
+                self.assertEqual(self.search(name=name), everything)
+        search.assert_not_called()
+
+    def test_wrong_limit(self):
+        response = self.client.get(self.url, {'name': 'мед', 'limit': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestReferenceDataCache(APITestCase):
+
+    url = '/api/tags/'
+
+    def setUp(self):
+        cache.clear()
+        self.tag = Tag.objects.create(
+            name='Обед', color='#49B64E', slug='lunch'
+        )
+
+    def test_not_modified_without_queries(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_gzip(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_invalidated_on_save(self):
+        etag = self.client.get(self.url)['ETag']
+        self.tag.name = 'Ужин'
+        self.tag.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()[0]['name'], 'Ужин')
+
+
+class TestFillDB(APITestCase):
+
+    data_directory = os.path.join(settings.BASE_DIR, 'data')
+
+    def filldb(self, *args):
+        out = StringIO()
+        call_command(
+            'filldb', '--data_directory', self.data_directory, *args,
+            stdout=out
+        )
+        return out.getvalue()
+
+    def test_load_is_idempotent(self):
+        self.assertIn('inserted 2188', self.filldb())
+        self.assertIn(
+            'inserted 0, updated 0, skipped 2188',
+            self.filldb('--format', 'json')
+        )
+        self.assertEqual(Ingredient.objects.count(), 2188)
+        self.assertTrue(
+            Ingredient.objects.filter(search_name='ячневая крупа').exists()
+        )
+
+    def test_dry_run(self):
+        output = self.filldb('--format', 'json', '--dry-run', '--diff')
+        self.assertIn('+ абрикосовое варенье (г)', output)
+        self.assertFalse(Ingredient.objects.exists())
+
+
+class TemporaryMediaMixin(RecipesTestMixin):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_authenticate(self.user)
+
+    @staticmethod
+    def image_data(size=(1600, 1000)):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'orange').save(buffer, 'PNG')
+        encoded = base64.b64encode(buffer.getvalue()).decode()
+        return f'data:image/png;base64,{encoded}'
+
+
+class TestImageVariants(TemporaryMediaMixin, APITestCase):
+
+    def test_variants_scheduled_and_exposed(self):
+        with mock.patch('api.serializers.schedule_variants') as schedule:
+            response = self.client.post('/api/recipes/', {
+                'name': 'Омлет', 'text': 'Текст', 'cooking_time': 5,
+                'tags': [self.tag.id], 'image': self.image_data(),
+                'ingredients': [{'id': self.milk.id, 'amount': 100}],
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['image_variants'], {})
+        recipe = schedule.call_args[0][0]
+        generate_variants(recipe.id, recipe.image.name)
+        recipe.refresh_from_db()
+        card = recipe.image_variants['card']
+        with recipe.image.storage.open(card['jpg']) as file:
+            self.assertEqual(Image.open(file).size, (480, 300))
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertTrue(
+            response.json()['image_variants']['card_2x']['webp'].startswith(
+                'http://testserver/media/variants/'
+            )
+        )
+
+
+class TestContentAddressedStorage(TemporaryMediaMixin, APITestCase):
+
+    def post_image(self, image):
+        response = self.client.post('/api/recipes/', {
+            'name': 'Омлет', 'text': 'Текст', 'cooking_time': 5,
+            'tags': [self.tag.id], 'image': image,
+            'ingredients': [{'id': self.milk.id, 'amount': 100}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Recipe.objects.get(id=response.json()['id'])
+
+    def test_dedup_refreshes_mtime(self):
+        storage = Recipe._meta.get_field('image').storage
+        name = storage.save('recipes/a.png', ContentFile(b'content'))
+        os.utime(storage.path(name), (0, 0))
+        self.assertEqual(
+            storage.save('recipes/b.png', ContentFile(b'content')), name
+        )
+        self.assertGreater(os.path.getmtime(storage.path(name)), 0)
+
+    def test_racing_save_keeps_content_name(self):
+        storage = Recipe._meta.get_field('image').storage
+        name = storage.save('recipes/a.png', ContentFile(b'content'))
+        # Второй загрузчик не увидел файл и пишет его заново.
+        with mock.patch('recipes.storage.os.utime',
+                        side_effect=FileNotFoundError):
+            self.assertEqual(
+                storage.save('recipes/b.png', ContentFile(b'content')), name
+            )
+        directory, files = storage.listdir(os.path.dirname(name))
+        self.assertEqual(files, [os.path.basename(name)])
+        with storage.open(name) as file:
+            self.assertEqual(file.read(), b'content')
+
+    def test_same_content_stored_once(self):
+        image = self.image_data((10, 10))
+        first = self.post_image(image)
+        second = self.post_image(image)
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(
+            first.image.name, self.post_image(self.image_data()).image.name
+        )
+
+    def test_collect_media(self):
+        recipe = self.post_image(self.image_data((10, 10)))
+        old_name = recipe.image.name
+        self.client.patch(f'/api/recipes/{recipe.id}/', {
+            'name': 'Омлет', 'text': 'Текст', 'cooking_time': 5,
+            'tags': [self.tag.id], 'image': self.image_data((20, 20)),
+            'ingredients': [{'id': self.milk.id, 'amount': 100}],
+        }, format='json')
+        out = StringIO()
+        call_command('collect_media', '--min-age', '0', stdout=out)
+        self.assertIn('removed: 1', out.getvalue())
+        storage = recipe.image.storage
+        self.assertFalse(storage.exists(old_name))
+        recipe.refresh_from_db()
+        self.assertTrue(storage.exists(recipe.image.name))
+
+
+class TestToggles(RecipesTestMixin, APITestCase):
+
+    def setUp(self):
+        self.recipe = self.create_recipe()
+        self.client.force_authenticate(self.user)
+
+    def test_favorite(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        # Вставка и счётчик в одной транзакции: SAVEPOINT и RELEASE.
+        with self.assertNumQueries(5):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['name'], self.recipe.name)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.recipe.favorites.count(), 1)
+        with self.assertNumQueries(4):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_missing_recipe(self):
+        for method in (self.client.post, self.client.delete):
+            response = method('/api/recipes/0/favorite/')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_shopping_cart_twice(self):
+        url = f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        self.assertEqual(
+            self.client.post(url).status_code, status.HTTP_201_CREATED
+        )
+        self.assertEqual(
+            self.client.post(url).status_code, status.HTTP_400_BAD_REQUEST
+        )
+        self.assertEqual(self.recipe.shopping_carts.count(), 1)
+
+    def test_subscribe(self):
+        author = User.objects.create_user(
+            email='author@test.test', username='Author',
+            first_name='A', last_name='A', password='TestPassword',
+        )
+        url = f'/api/users/{author.id}/subscribe/'
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.json()['is_subscribed'])
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for user_id in (self.user.id, f'0{self.user.id}'):
+            response = self.client.post(f'/api/users/{user_id}/subscribe/')
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+        self.assertEqual(
+            self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT
+        )
+        self.assertEqual(
+            self.client.delete(url).status_code, status.HTTP_400_BAD_REQUEST
+        )
+
+
+class TestCounters(RecipesTestMixin, APITestCase):
+
+    def setUp(self):
+        self.recipe = self.create_recipe()
+        self.client.force_authenticate(self.user)
+
+    def test_toggles_update_counters(self):
+        for url in ('favorite', 'shopping_cart'):
+            self.client.post(f'/api/recipes/{self.recipe.id}/{url}/')
+            self.client.post(f'/api/recipes/{self.recipe.id}/{url}/')
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.recipe.in_cart_count, 1)
+        self.client.delete(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.client.delete(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertEqual(self.recipe.in_cart_count, 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.recipes_count, 1)
+        self.client.delete(f'/api/recipes/{self.recipe.id}/')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.recipes_count, 0)
+
+    def test_order_by_popularity(self):
+        popular = self.create_recipe('Суп')
+        self.client.post(f'/api/recipes/{popular.id}/favorite/')
+        response = self.client.get(
+            '/api/recipes/', {'ordering': '-favorites_count'}
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [popular.id, self.recipe.id],
+        )
+        self.assertNotIn('favorites_count', response.json()['results'][0])
+
+    def test_reconcile_counters(self):
+        Recipe.objects.filter(pk=self.recipe.pk).update(favorites_count=5)
+        out = StringIO()
+        call_command('reconcile_counters', '--verify', stdout=out)
+        self.assertIn(
+            'recipe.favorites_count: 1 rows out of sync', out.getvalue()
+        )
+        self.assertIn('user.recipes_count: 0 rows out of sync', out.getvalue())
+        call_command('reconcile_counters', stdout=StringIO())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_reconcile_ignores_deleted_users(self):
+        follower = User.objects.create_user(
+            email='follower@test.test', username='Follower',
+            first_name='F', last_name='F', password='TestPassword',
+        )
+        self.client.force_authenticate(follower)
+        self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.client.post(f'/api/users/{self.user.id}/subscribe/')
+        follower.delete()
+        call_command('reconcile_counters', stdout=StringIO())
+        self.recipe.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertEqual(self.user.followers_count, 0)
+
+    def test_backfill_ignores_deleted_users(self):
+        follower = User.objects.create_user(
+            email='follower@test.test', username='Follower',
+            first_name='F', last_name='F', password='TestPassword',
+        )
+        self.client.force_authenticate(follower)
+        self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.client.post(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+        self.client.post(f'/api/users/{self.user.id}/subscribe/')
+        follower.delete()
+        for name in (
+            'recipes.migrations.0012_auto_20261017_0421',
+            'users.migrations.0010_auto_20261017_0421',
+        ):
+            import_module(name).fill_counters(apps, None)
+        self.recipe.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertEqual(self.recipe.in_cart_count, 0)
+        self.assertEqual(self.user.followers_count, 0)
+        self.assertEqual(self.user.recipes_count, 1)
+
+
+class TestRecipeAdmin(RecipesTestMixin, APITestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            email='admin@test.test', password='TestPassword',
+            username='Admin', first_name='Admin', last_name='Admin',
+        )
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/admin/recipes/recipe/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context)
+
+    def test_changelist_queries_do_not_grow(self):
+        self.create_recipe('Суп')
+        queries = self.changelist_queries()
+        for name in ('Борщ', 'Плов', 'Омлет'):
+            self.create_recipe(name)
+        self.assertEqual(self.changelist_queries(), queries)
+
+    def test_prefix_search(self):
+        baker = User.objects.create_user(
+            email='baker@test.test', password='TestPassword',
+            username='Baker', first_name='B', last_name='B',
+        )
+        for name in ('Борщ', 'Борщевик', 'Плов'):
+            self.create_recipe(name)
+        self.create_recipe('Хлеб', author=baker)
+
+        def search(term):
+            response = self.client.get('/admin/recipes/recipe/', {'q': term})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return {
+                recipe.name for recipe in response.context['cl'].result_list
+            }
+
+        self.assertEqual(search('Борщ'), {'Борщ', 'Борщевик'})
+        self.assertEqual(search('Bak'), {'Хлеб'})
+        # Как и поиск пользователей, с учётом регистра.
+        self.assertEqual(search('борщ'), set())
+        self.assertEqual(search('лов'), set())
+
+    def test_inline_is_paginated(self):
+        recipe = self.create_recipe()
+        FavorRecipe.objects.bulk_create(
+            FavorRecipe(
+                recipe=recipe,
+                user=User.objects.create_user(
+                    email=f'fan{number}@test.test', password='TestPassword',
+                    username=f'fan{number}', first_name='F', last_name='F',
+                ),
+            )
+            for number in range(25)
+        )
+        url = f'/admin/recipes/recipe/{recipe.id}/change/'
+        response = self.client.get(url)
+        self.assertContains(
+            response, 'name="favorrecipe_set-INITIAL_FORMS" value="20"'
+        )
+        response = self.client.get(url, {'favorrecipe_set-page': 2})
+        self.assertContains(
+            response, 'name="favorrecipe_set-INITIAL_FORMS" value="5"'
+        )
+
+
+class TestRecipeSearch(RecipesTestMixin, APITestCase):
+
+    url = '/api/recipes/'
+
+    def search(self, query, **params):
+        response = self.client.get(self.url, {'search': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [recipe['name'] for recipe in response.json()['results']]
+
+    def test_ranked_by_relevance(self):
+        self.create_recipe('Салат')
+        Recipe.objects.filter(name='Салат').update(text='Тёртая свёкла')
+        self.create_recipe('Свёкла печёная')
+        self.create_recipe('Омлет')
+        self.assertEqual(
+            self.search('свёкла'), ['Свёкла печёная', 'Салат']
+        )
+
+    def test_index_follows_writes(self):
+        recipe = self.create_recipe('Блины')
+        self.assertEqual(self.search('блины'), ['Блины'])
+        recipe.name = 'Оладьи'
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+        self.assertEqual(self.search('блины'), [])
+        self.assertEqual(self.search('оладьи'), ['Оладьи'])
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertEqual(self.search('оладьи'), [])
+
+    def test_combines_with_filters(self):
+        other = Tag.objects.create(name='Обед', color='#000000', slug='lunch')
+        self.create_recipe('Суп гороховый')
+        self.create_recipe('Суп куриный').tags.set([other])
+        self.assertEqual(
+            self.search('суп', tags='lunch'), ['Суп куриный']
+        )
+        self.assertEqual(
+            self.search('суп', author=self.user.id, ordering='-id'),
+            ['Суп куриный', 'Суп гороховый'],
+        )
+
+
+class TestRecipeFilters(RecipesTestMixin, APITestCase):
+
+    url = '/api/recipes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.lunch = Tag.objects.create(
+            name='Обед', color='#000000', slug='lunch'
+        )
+        cls.authors = [cls.user] + [
+            User.objects.create_user(
+                email=f'author{index}@test.test', username=f'author{index}',
+                first_name='A', last_name='A', password='TestPassword',
+            )
+            for index in range(10)
+        ]
+        for author in cls.authors:
+            recipe = cls.create_recipe(f'Рецепт {author.id}', author=author)
+            recipe.tags.add(cls.lunch)
+
+    def get_ids(self, params):
+        response = self.client.get(self.url, {'limit': 100, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [recipe['author']['id'] for recipe in response.json()['results']]
+
+    def test_author_exact(self):
+        first, tenth = self.authors[0], self.authors[9]
+        self.assertEqual(self.get_ids({'author': first.id}), [first.id])
+        self.assertEqual(
+            self.get_ids({'author': f'{first.id},{tenth.id}'}),
+            [first.id, tenth.id],
+        )
+        response = self.client.get(self.url, {'author': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tags_without_duplicates(self):
+        ids = self.get_ids({'tags': ['breakfast', 'lunch']})
+        self.assertEqual(len(ids), len(self.authors))
+        self.assertEqual(self.get_ids({'tags': 'unknown'}), [])
+
+    def test_tag_slugs_cached(self):
+        self.get_ids({'tags': 'lunch'})
+        with CaptureQueriesContext(connection) as context:
+            self.get_ids({'tags': 'lunch'})
+        self.assertFalse(
+            any('FROM "recipes_tag" WHERE' in query['sql']
+                for query in context)
+        )
+        Tag.objects.create(name='Ужин', color='#111111', slug='dinner')
+        self.assertEqual(self.get_ids({'tags': 'dinner'}), [])
+
+
+class TestBenchmark(APITestCase):
+
+    def test_recipe_filters(self):
+        out = StringIO()
+        call_command(
+            'benchmark', 'recipe_filters', '--repeat', '1',
+            '--scale', '200', stdout=out,
+        )
+        self.assertIn('recipes=200 tags=2', out.getvalue())
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(Tag.objects.exists())
+
+
+class TestAnonymousCache(RecipesTestMixin, APITestCase):
+
+    url = '/api/recipes/'
+
+    def setUp(self):
+        self.recipe = self.create_recipe()
+
+    def test_list_and_detail_cached(self):
+        for url in (self.url, f'{self.url}{self.recipe.id}/'):
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_links_follow_host_and_scheme(self):
+        self.recipe.image = 'recipes/image.jpg'
+        self.recipe.save()
+        url = f'{self.url}{self.recipe.id}/'
+        self.client.get(url, HTTP_HOST='backend:8000')
+        response = self.client.get(
+            url, HTTP_HOST='foodgram.example', secure=True
+        )
+        self.assertTrue(
+            response.json()['image'].startswith('https://foodgram.example/')
+        )
+
+    def test_normalized_params(self):
+        self.client.get(self.url, {'limit': 6, 'tags': ['b', 'a']})
+        with self.assertNumQueries(0):
+            self.client.get(f'{self.url}?tags=a&tags=b&limit=6&author=')
+
+    def test_invalidated_on_change(self):
+        self.client.get(self.url)
+        self.recipe.name = 'Новое название'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response.json()['results'][0]['name'], 'Новое название'
+        )
+        self.user.first_name = 'Повар'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response.json()['results'][0]['author']['first_name'], 'Повар'
+        )
+
+    def test_login_does_not_invalidate(self):
+        self.client.get(self.url)
+        self.user.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+    def test_invalidated_after_commit(self):
+        self.client.get(self.url)
+        self.recipe.name = 'Новое название'
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.recipe.save()
+            with self.assertNumQueries(0):
+                self.client.get(self.url)
+        self.assertTrue(callbacks)
+
+    def test_users_without_recipes_do_not_invalidate(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            other = User.objects.create_user(
+                email='other@example.com', username='other',
+                first_name='Other', last_name='User', password='password',
+            )
+            other.first_name = 'Другой'
+            other.save()
+            self.user.set_password('new-password')
+            self.user.save(update_fields=['password'])
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+    def test_authenticated_not_cached(self):
+        self.client.get(self.url)
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.url)
+        self.assertIn('is_favorited', response.data['results'][0])
+
+
+class TestRelations(RecipesTestMixin, APITestCase):
+
+    url = '/api/recipes/'
+
+    def setUp(self):
+        self.recipe = self.create_recipe()
+        self.other = self.create_recipe('Суп')
+        self.client.force_authenticate(self.user)
+
+    def flags(self, **params):
+        response = self.client.get(self.url, params)
+        return {
+            recipe['id']: (
+                recipe['is_favorited'], recipe['is_in_shopping_cart'],
+                recipe['author']['is_subscribed'],
+            )
+            for recipe in response.json()['results']
+        }
+
+    def test_flags_follow_toggles(self):
+        self.assertEqual(self.flags()[self.recipe.id], (False, False, False))
+        self.client.post(f'{self.url}{self.recipe.id}/favorite/')
+        self.client.post(f'{self.url}{self.other.id}/shopping_cart/')
+        flags = self.flags()
+        self.assertEqual(flags[self.recipe.id], (True, False, False))
+        self.assertEqual(flags[self.other.id], (False, True, False))
+        self.assertEqual(list(self.flags(is_favorited=1)), [self.recipe.id])
+        self.assertEqual(
+            list(self.flags(is_in_shopping_cart=1)), [self.other.id]
+        )
+        self.client.delete(f'{self.url}{self.recipe.id}/favorite/')
+        self.assertEqual(self.flags(is_favorited=1), {})
+
+    def test_list_without_subqueries(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.url, {'is_favorited': 1})
+        self.assertFalse(
+            any('EXISTS' in query['sql'] for query in context)
+        )
+
+
+class TestFastJSON(APITestCase):
+
+    data = {
+        'name': 'Каша \u2028 с\u2029молоком',
+        'amount': Decimal('1.50'),
+        'created': datetime.datetime(2023, 1, 2, 3, 4, 5, 6, timezone.utc),
+        'day': datetime.date(2023, 1, 2),
+        'label': gettext_lazy('Рецепт'),
+        'nested': [{'id': 1, 'ok': True, 'none': None, 'ratio': 0.1}],
+    }
+
+    def test_renderer_matches_json_renderer(self):
+        expected = JSONRenderer().render(self.data)
+        self.assertEqual(FastJSONRenderer().render(self.data), expected)
+        with mock.patch('api.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.data), expected)
+
+    def test_parser(self):
+        body = '{"name": "Каша", "image": "data:image/png;base64,AAAA"}'
+        for parser in (FastJSONParser(), JSONParser()):
+            self.assertEqual(
+                parser.parse(BytesIO(body.encode())),
+                {'name': 'Каша', 'image': 'data:image/png;base64,AAAA'},
+            )
+            with self.assertRaises(ParseError):
+                parser.parse(BytesIO(b'{"name": NaN}'))
+
+    def test_api_uses_fast_renderer(self):
+        user = User.objects.create_user(
+            email='cook@test.test', username='Cook',
+            first_name='Cook', last_name='Cook', password='TestPassword',
+        )
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/recipes/')
+        self.assertIsInstance(
+            response.accepted_renderer, FastJSONRenderer
+        )
@@ -1,7 +1,25 @@
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.signals import user_login_failed
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from api.views import UserViewSet
+from recipes.models import Recipe
+from rest_framework.authtoken.models import Token
+from users.authentication import (CachedTokenAuthentication, TokenCache,
+                                  token_cache)
+from users.models import UserSubscription
 
 User = get_user_model()
 
@@ -86,3 +104,304 @@ class TestUser(APITestCase):
         }
         response = self.client.post(url, correct_data, format='json')
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+
+class TestSubscriptions(APITestCase):
+
+    url = '/api/users/subscriptions/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@test.test', username='Reader',
+            first_name='Reader', last_name='Reader', password='TestPassword',
+        )
+        for index in range(5):
+            author = User.objects.create_user(
+                email=f'author{index}@test.test', username=f'author{index}',
+                first_name='A', last_name='A', password='TestPassword',
+            )
+            for number in range(index + 1):
+                Recipe.objects.create(
+                    author=author, name=f'Рецепт {number}', text='Текст',
+                    cooking_time=5,
+                )
+            cls.user.subscription.add(author)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_recipes_limit(self):
+        response = self.client.get(
+            self.url, {'limit': 10, 'recipes_limit': 2}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for author in response.data['results']:
+            self.assertEqual(
+                len(author['recipes']), min(author['recipes_count'], 2)
+            )
+        self.assertEqual(
+            sorted(a['recipes_count'] for a in response.data['results']),
+            [1, 2, 3, 4, 5]
+        )
+
+    def test_first_recipes_in_order(self):
+        for recipes_limit in (1, 3):
+            cache.clear()
+            with self.assertNumQueries(4):
+                response = self.client.get(
+                    self.url, {'limit': 10, 'recipes_limit': recipes_limit}
+                )
+            for author in response.data['results']:
+                self.assertEqual(
+                    [recipe['id'] for recipe in author['recipes']],
+                    list(Recipe.objects.filter(
+                        author=author['id']
+                    ).order_by('id').values_list(
+                        'id', flat=True
+                    )[:recipes_limit]),
+                )
+
+    def test_no_subscriptions(self):
+        self.user.subscription.clear()
+        response = self.client.get(self.url, {'recipes_limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
+
+    def test_queries_do_not_depend_on_page_size(self):
+        for limit in (1, 5):
+            cache.clear()
+            with self.assertNumQueries(4):
+                self.client.get(self.url, {'limit': limit})
+
+    def test_cursor_pages(self):
+        response = self.client.get(self.url, {'cursor': '', 'limit': 2})
+        ids = [author['id'] for author in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids += [author['id'] for author in response.data['results']]
+        self.assertEqual(
+            ids, sorted(self.user.subscription.values_list('id', flat=True))
+        )
+
+    def test_wrong_recipes_limit(self):
+        for value in ('-1', 'abc'):
+            response = self.client.get(self.url, {'recipes_limit': value})
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+
+
+class TestUserAdmin(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@test.test', password='TestPassword',
+            username='Admin', first_name='Admin', last_name='Admin',
+        )
+        cls.authors = [
+            User.objects.create_user(
+                email=f'author{index}@test.test', username=f'author{index}',
+                first_name='A', last_name='A', password='TestPassword',
+            )
+            for index in range(25)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_prefix_search(self):
+        response = self.client.get(
+            '/admin/users/user/', {'q': 'author1'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {user.username for user in response.context['cl'].result_list},
+            {'author1'} | {f'author1{index}' for index in range(10)},
+        )
+
+    def test_subscription_inline_is_paginated(self):
+        UserSubscription.objects.bulk_create(
+            UserSubscription(user=self.admin, subscribe_to=author)
+            for author in self.authors
+        )
+        url = f'/admin/users/user/{self.admin.id}/change/'
+        response = self.client.get(url)
+        self.assertContains(
+            response, 'name="usersubscription_set-INITIAL_FORMS" value="20"'
+        )
+        response = self.client.get(url, {'usersubscription_set-page': 2})
+        self.assertContains(
+            response, 'name="usersubscription_set-INITIAL_FORMS" value="5"'
+        )
+
+
+@mock.patch.object(
+    UserViewSet, 'authentication_classes', [CachedTokenAuthentication]
+)
+class TestCachedTokenAuthentication(APITestCase):
+
+    url = '/api/users/me/'
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            email='reader@test.test', username='Reader',
+            first_name='Reader', last_name='Reader', password='TestPassword',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_is_checked_once(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.json()['username'], 'Reader')
+
+    def test_logout_forgets_token(self):
+        self.client.get(self.url)
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_change_is_visible(self):
+        self.client.get(self.url)
+        self.user.first_name = 'Changed'
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['first_name'], 'Changed')
+
+    def test_login_keeps_tokens(self):
+        self.client.get(self.url)
+        self.user.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+
+class TestTokenCache(SimpleTestCase):
+
+    def entry(self, user_id):
+        return mock.Mock(pk=user_id), mock.Mock()
+
+    def test_delete_user(self):
+        tokens = TokenCache(max_size=10, timeout=60)
+        tokens.set('a', self.entry(1))
+        tokens.set('b', self.entry(1))
+        tokens.set('c', self.entry(2))
+        tokens.delete_user(1)
+        self.assertIsNone(tokens.get('a'))
+        self.assertIsNone(tokens.get('b'))
+        self.assertIsNotNone(tokens.get('c'))
+        self.assertEqual(tokens._keys_by_user, {2: {'c'}})
+
+    def test_index_follows_eviction_and_expiry(self):
+        tokens = TokenCache(max_size=2, timeout=60)
+        for key in ('a', 'b', 'c'):
+            tokens.set(key, self.entry(1))
+        self.assertEqual(tokens._keys_by_user, {1: {'b', 'c'}})
+        tokens.delete('b')
+        tokens.set('c', self.entry(2))
+        self.assertEqual(tokens._keys_by_user, {2: {'c'}})
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(tokens.get('c'))
+        self.assertEqual(tokens._keys_by_user, {})
+
+
+class TestLogin(APITestCase):
+
+    url = '/api/auth/token/login/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@test.test', username='Reader',
+            first_name='Reader', last_name='Reader', password='TestPassword',
+        )
+
+    def login(self, email, password):
+        with mock.patch.object(
+            PBKDF2PasswordHasher, 'encode',
+            autospec=True, side_effect=PBKDF2PasswordHasher.encode,
+        ) as encode:
+            data = {'email': email}
+            if password is not None:
+                data['password'] = password
+            response = self.client.post(self.url, data)
+        self.assertEqual(encode.call_count, 1)
+        return response
+
+    def test_success(self):
+        response = self.login('Reader@test.test', 'TestPassword')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('auth_token', response.json())
+
+    def test_failures_hash_once(self):
+        for email, password in (
+            ('reader@test.test', 'wrong'),
+            ('unknown@test.test', 'TestPassword'),
+            ('reader@test.test', None),
+            ('unknown@test.test', None),
+        ):
+            response = self.login(email, password)
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+
+    def test_failure_signal(self):
+        handler = mock.Mock()
+        user_login_failed.connect(handler)
+        self.addCleanup(user_login_failed.disconnect, handler)
+        self.login('reader@test.test', 'wrong')
+        self.assertEqual(
+            handler.call_args.kwargs['credentials']['email'],
+            'reader@test.test',
+        )
+
+    def test_inactive(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.login('reader@test.test', 'TestPassword')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestImportUsers(APITestCase):
+
+    def import_users(self, rows, *args):
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.csv', encoding='utf-8', delete=False
+        ) as file:
+            file.write('email,username,first_name,last_name,password\n')
+            file.writelines(f'{",".join(row)}\n' for row in rows)
+        self.addCleanup(os.remove, file.name)
+        out = StringIO()
+        call_command('importusers', file.name, *args, stdout=out)
+        return out.getvalue()
+
+    def test_import(self):
+        User.objects.create_user(
+            email='taken@test.test', username='Taken',
+            first_name='T', last_name='T', password='TestPassword',
+        )
+        rows = [
+            (f'User{index}@test.test', f'user{index}', 'U', 'U', f'pass{index}')
+            for index in range(3)
+        ] + [
+            ('TAKEN@test.test', 'other', 'U', 'U', 'pass'),
+            ('new@test.test', 'user0', 'U', 'U', 'pass'),
+        ]
+        output = self.import_users(rows, '--workers', '2')
+        self.assertIn('inserted 3, skipped 2', output)
+        user = User.objects.get(username='user2')
+        self.assertEqual(user.email, 'user2@test.test')
+        self.assertTrue(user.check_password('pass2'))
+
+    def test_missing_columns(self):
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.csv', delete=False
+        ) as file:
+            file.write('email,password\n')
+        self.addCleanup(os.remove, file.name)
+        with self.assertRaises(CommandError):
+            call_command('importusers', file.name, stdout=StringIO())